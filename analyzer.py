@@ -0,0 +1,145 @@
+import asyncio
+import random
+import time
+
+import anthropic
+
+from batching import countUsage, estimateTokens, splitMissing, usageRecord
+from main import MAX_TOKENS, messageParams, printUsage, readAnalysis, requireApiKey
+from metrics import count, span
+
+RETRY_STATUS = (429, 500, 503, 529)
+
+
+# async token bucket, refilled continuously at rate tokens per second up to capacity
+class TokenBucket:
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def refill(self):
+        current = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (current - self.updated) * self.rate)
+        self.updated = current
+
+    async def acquire(self, tokens=1):
+        tokens = min(tokens, self.capacity)
+        async with self.lock:
+            self.refill()
+            while self.tokens < tokens:
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+                self.refill()
+            self.tokens -= tokens
+
+
+def retryAfter(error):
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+# runs analysis batches concurrently on one shared AsyncAnthropic client
+# concurrency bounds the requests in flight, requestsPerMinute/tokensPerMinute feed two token buckets
+class AsyncAnalyzer:
+
+    def __init__(self, concurrency=4, requestsPerMinute=50, tokensPerMinute=None, retries=5,
+                 backoff=1.0, maxBackoff=60.0, baseUrl=None, client=None, usageLog=None, mode='json'):
+        self.concurrency = concurrency
+        self.requests = TokenBucket(requestsPerMinute / 60, capacity=concurrency)
+        self.tokens = TokenBucket(tokensPerMinute / 60, capacity=tokensPerMinute) if tokensPerMinute else None
+        self.retries = retries
+        self.backoff = backoff
+        self.maxBackoff = maxBackoff
+        self.baseUrl = baseUrl
+        self.client = client
+        self.ownClient = client is None
+        self.semaphore = None
+        self.usageLog = usageLog if usageLog is not None else []
+        self.mode = mode
+
+    async def __aenter__(self):
+        if self.ownClient:
+            requireApiKey()
+            #retries are handled here (with jitter and the rate limiter), not inside the SDK
+            self.client = anthropic.AsyncAnthropic(base_url=self.baseUrl, max_retries=0)
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        return self
+
+    async def __aexit__(self, *exc):
+        if self.ownClient:
+            await self.client.close()
+
+    async def createMessage(self, params):
+        for attempt in range(1, self.retries + 1):
+            await self.requests.acquire()
+            if self.tokens is not None:
+                await self.tokens.acquire(estimateTokens(params['messages'][0]['content']) + params['max_tokens'])
+            try:
+                async with self.semaphore:
+                    with span('llm.request', max_tokens=params['max_tokens'], attempt=attempt):
+                        return await self.client.messages.create(**params)
+
+            except (anthropic.APIStatusError, anthropic.APIConnectionError) as e:
+                status = getattr(e, 'status_code', None)
+                if attempt == self.retries or (status is not None and status not in RETRY_STATUS):
+                    raise
+                #full jitter backoff, unless the server said how long to wait
+                delay = retryAfter(e) or random.uniform(0, min(self.maxBackoff, self.backoff * 2 ** attempt))
+                count('llm.retries')
+                print(f"LLM request failed ({status or 'connection error'}), retry {attempt}/{self.retries - 1} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    #same splitting as main.analyzeBatch: only reviews without a usable result are sent again
+    async def analyzeBatch(self, reviews, maxTokens=MAX_TOKENS):
+        try:
+            message = await self.createMessage(messageParams(reviews, maxTokens, self.mode))
+        except Exception as e:
+            print("error loading the LLM ", e)
+            return [None] * len(reviews)
+
+        usage = usageRecord(reviews, message)
+        countUsage(usage)
+        printUsage(usage)
+        self.usageLog.append(usage)
+
+        matched = readAnalysis(reviews, message)
+        if len(reviews) == 1:
+            if matched[0] is None and usage['stop_reason'] == 'max_tokens' and maxTokens < MAX_TOKENS * 4:
+                return await self.analyzeBatch(reviews, maxTokens * 2)
+            return matched
+
+        results = dict(zip(reviews, matched))
+        parts = splitMissing(reviews, matched)
+        partResults = await asyncio.gather(*(self.analyzeBatch(part, maxTokens) for part in parts))
+        for part, partResult in zip(parts, partResults):
+            results.update(zip(part, partResult))
+        return [results[review] for review in reviews]
+
+    #yields every batch's results in input order, while later batches are still in flight
+    async def iterAnalyses(self, batches):
+        tasks = [asyncio.ensure_future(self.analyzeBatch(batch)) for batch in batches]
+        try:
+            for batch, task in zip(batches, tasks):
+                yield batch, await task
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+#sync entry point: runs the async engine with asyncio.run and calls
+#onBatch(reviews, results) for each batch in input order
+def analyzeBatches(batches, onBatch, usageLog=None, **options):
+    async def run():
+        async with AsyncAnalyzer(usageLog=usageLog, **options) as analyzer:
+            async for batch, analysis in analyzer.iterAnalyses(batches):
+                onBatch(batch, analysis)
+
+    asyncio.run(run())
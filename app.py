@@ -1,26 +1,48 @@
+import os
+import re
+from datetime import date
+from functools import lru_cache
+from math import ceil
+
 import streamlit as st
-import pandas as pd
-import json
-
-# Load the analyzed review data
-def load_data(file_path):
-    with open(file_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    return pd.DataFrame(data)
-
-# Highlight keywords in text
-def highlight_text(review, food_comments, staff_comments):
-    food_highlight = f"<span style='background-color:#F9E79F; color:#935116; font-weight:bold;'>{food_comments}</span>" if food_comments != 'None' else ''
-    staff_highlight = f"<span style='background-color:#D6EAF8; color:#2C598C; font-weight:bold;'>{staff_comments}</span>" if staff_comments != 'None' else ''
-    
-    # Replace comments in review with highlighted versions
-    highlighted_review = review
-    if food_comments != 'None' and food_comments in review:
-        highlighted_review = highlighted_review.replace(food_comments, food_highlight)
-    if staff_comments != 'None' and staff_comments in review:
-        highlighted_review = highlighted_review.replace(staff_comments, staff_highlight)
-    
-    return highlighted_review
+from recordio import lastModified
+from reviewindex import loadIndex
+
+# Search index over the data, kept across reruns and rebuilt only when the file's mtime changes
+@st.cache_resource(max_entries=2, show_spinner="Indexing reviews...")
+def load_index(file_path, mtime):
+    return loadIndex(file_path)
+
+FOOD_STYLE = "background-color:#F9E79F; color:#935116; font-weight:bold;"
+STAFF_STYLE = "background-color:#D6EAF8; color:#2C598C; font-weight:bold;"
+KEYWORD_STYLE = "background-color:#D5F5E3; color:#1E8449; font-weight:bold;"
+
+# Regex for the searched words the way the index matches them (whole words, the last one as a prefix)
+@lru_cache(maxsize=64)
+def keyword_pattern(keyword):
+    words = re.findall(r'\w+', keyword or '')
+    if not words:
+        return ''
+    return r'(?i:\b' + r'\W+'.join(re.escape(word) for word in words) + r'\w*)'
+
+# Highlight the food comments, staff comments and searched words in a single regex pass over the review
+def highlight_text(review, food_comments, staff_comments, keyword=''):
+    styles = {}
+    for comment, style in ((food_comments, FOOD_STYLE), (staff_comments, STAFF_STYLE)):
+        if comment != 'None' and comment in review:
+            styles.setdefault(comment, style)
+
+    # Longest terms first so a comment wins over a shorter one it contains
+    alternatives = [re.escape(term) for term in sorted(styles, key=len, reverse=True)]
+    if keyword_pattern(keyword):
+        alternatives.append(keyword_pattern(keyword))
+    if not alternatives:
+        return review
+
+    def mark(match):
+        return f"<span style='{styles.get(match.group(0), KEYWORD_STYLE)}'>{match.group(0)}</span>"
+
+    return re.sub('|'.join(alternatives), mark, review)
 
 # Main dashboard function
 
@@ -45,7 +67,10 @@ st.write("Search and visualize food and staff-related comments from customer rev
 
 # Load data
 data_file = 'reviews_analysis.json'  # Path to the JSON file
-df = load_data(data_file)
+# The typed archive (generateReviewsAnalysis(..., output='reviews_analysis.archive')) is used when there is one
+if os.path.isdir('reviews_analysis.archive'):
+    data_file = 'reviews_analysis.archive'
+index = load_index(data_file, lastModified(data_file))
 
 # Sidebar for search
 st.sidebar.title("Search Reviews")
@@ -63,25 +88,45 @@ st.sidebar.markdown('<div class="sidebar-title">Search Reviews</div>', unsafe_al
 
 search_keyword = st.sidebar.text_input("Enter a keyword to search (e.g., 'delicious', 'rude', etc.)", "")
 
-# Filter data if a search keyword is provided
-if search_keyword:
-    filtered_df = df[
-        df['review'].str.contains(search_keyword, case=False, na=False) |
-        df['food_comments'].str.contains(search_keyword, case=False, na=False) |
-        df['staff_comments'].str.contains(search_keyword, case=False, na=False)
-    ]
-else:
-    filtered_df = df
+# Filters, all applied inside the index
+sentiments = [value for value in index.values('sentiment') if value != 'None']
+sentiment_filter = st.sidebar.selectbox("Sentiment", ["All"] + sentiments)
+filters = {'sentiment': None if sentiment_filter == "All" else sentiment_filter}
+
+restaurants = [value for value in index.values('restaurant') if value != 'None']
+if len(restaurants) > 1:
+    filters['restaurants'] = st.sidebar.multiselect("Restaurants", restaurants)
+
+first_date, last_date = index.dateRange()
+if first_date:
+    full_range = (date.fromisoformat(first_date), date.fromisoformat(last_date))
+    date_range = st.sidebar.date_input("Dined between", full_range)
+    # While the range is being picked only its start is set, reviews without a known date only drop out
+    # once the range is narrowed
+    if len(date_range) == 2 and tuple(date_range) != full_range:
+        filters['since'], filters['until'] = date_range[0].isoformat(), date_range[1].isoformat()
+
+page_size = st.sidebar.selectbox("Reviews per page", [10, 25, 50, 100], index=1)
+
+# Only the current page is fetched and rendered, however many reviews match
+total = index.count(search_keyword, **filters)
+pages = max(1, ceil(total / page_size))
+# The page number starts over whenever the search or the filters change
+page_key = 'page-' + repr((search_keyword, sorted(filters.items()), page_size))
+page = st.sidebar.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, key=page_key)
+st.caption(f"{total} matching reviews, page {page} of {pages}")
+
+page_rows = index.searchRows(search_keyword, limit=page_size, offset=(page - 1) * page_size, **filters)
 
 # Display data in the main section
-for _, row in filtered_df.iterrows():
+for row in page_rows:
     review_text = row['review']
     food_comments = row['food_comments']
     staff_comments = row['staff_comments']
     sentiment = row['sentiment']
 
     # Highlight text
-    highlighted_review = highlight_text(review_text, food_comments, staff_comments)
+    highlighted_review = highlight_text(review_text, food_comments, staff_comments, search_keyword)
 
     # Display card-like layout
     st.markdown(f"""
@@ -0,0 +1,162 @@
+import glob
+import os
+import shutil
+import uuid
+from urllib.parse import unquote
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from recordio import RecordWriter, readRecords
+from reviewdates import DATE_FORMAT, normalizeDates
+
+#scraped record fields and the typed archive columns they are stored in
+REVIEW_FIELDS = {
+    'Restaurant Name': 'restaurant', 'Review': 'review', 'Date': 'date',
+    'Overall': 'overall', 'Food': 'food', 'Service': 'service', 'Ambience': 'ambience',
+}
+RATING_COLUMNS = ('overall', 'food', 'service', 'ambience')
+ANALYSIS_TEXT_COLUMNS = ('review', 'food_comments', 'staff_comments')
+
+#the directory layout is restaurant=<name>/scrape_date=<YYYY-MM-DD>/part-*.parquet
+PARTITIONS = ('restaurant', 'scrape_date')
+
+REVIEW_SCHEMA = pa.schema(
+    [('review', pa.string()), ('date', pa.timestamp('s'))]
+    + [(column, pa.int8()) for column in RATING_COLUMNS]
+    + [('scraped_at', pa.timestamp('s')), ('restaurant', pa.string()), ('scrape_date', pa.string())])
+ANALYSIS_SCHEMA = pa.schema(
+    [(column, pa.string()) for column in ANALYSIS_TEXT_COLUMNS]
+    + [('sentiment', pa.dictionary(pa.int8(), pa.string())), ('date', pa.timestamp('s')),
+       ('scraped_at', pa.timestamp('s')), ('restaurant', pa.string()), ('scrape_date', pa.string())])
+
+
+def isAnalysis(records):
+    return bool(records) and 'sentiment' in records[0]
+
+
+#scraped reviews as a typed table: ratings as small ints with nulls for 'None', dates as timestamps
+def reviewTable(records, scrapedAt=None):
+    scrapedAt = pd.Timestamp.now() if scrapedAt is None else pd.Timestamp(scrapedAt)
+    df = pd.DataFrame(records).rename(columns=REVIEW_FIELDS)
+    for column in RATING_COLUMNS:
+        df[column] = pd.to_numeric(df[column], errors='coerce').round() if column in df else None
+        df[column] = df[column].astype('Int8')
+    df['date'] = normalizeDates(df['date'], scrapedAt) if 'date' in df else pd.NaT
+    return typedTable(df, REVIEW_SCHEMA, scrapedAt)
+
+
+#analysis records as a typed table, the 'None' placeholders of missing comments become nulls
+def analysisTable(records, scrapedAt=None):
+    scrapedAt = pd.Timestamp.now() if scrapedAt is None else pd.Timestamp(scrapedAt)
+    df = pd.DataFrame(records)
+    for column in ANALYSIS_TEXT_COLUMNS + ('sentiment',):
+        df[column] = df[column].where(df[column] != 'None') if column in df else None
+    df['date'] = normalizeDates(df['date'], scrapedAt) if 'date' in df else pd.NaT
+    return typedTable(df, ANALYSIS_SCHEMA, scrapedAt)
+
+
+def typedTable(df, schema, scrapedAt):
+    df['scraped_at'] = scrapedAt
+    df['restaurant'] = df['restaurant'].where(df['restaurant'] != 'None').fillna('Unknown') \
+        if 'restaurant' in df else 'Unknown'
+    df['scrape_date'] = scrapedAt.strftime('%Y-%m-%d')
+    df['date'] = df['date'].astype('datetime64[s]')
+    df['scraped_at'] = df['scraped_at'].astype('datetime64[s]')
+    return pa.Table.from_pandas(df[schema.names], schema=schema, preserve_index=False)
+
+
+# writes scraped reviews or analysis records (whichever the first record looks like) to a typed parquet
+# archive partitioned by restaurant and scrape date, one set of part files per write like recordio.ParquetWriter
+# unless append is set, the first write of a restaurant replaces what the archive held for it
+class ArchiveWriter(RecordWriter):
+
+    def __init__(self, path, durable=False, append=False, scrapedAt=None):
+        super().__init__(path, durable)
+        os.makedirs(path, exist_ok=True)
+        self.append = append
+        self.scrapedAt = pd.Timestamp.now() if scrapedAt is None else pd.Timestamp(scrapedAt)
+        self.token = uuid.uuid4().hex[:8]
+        self.part = 0
+        self.replaced = set()
+
+    def write(self, records):
+        if not records:
+            return
+        toTable = analysisTable if isAnalysis(records) else reviewTable
+        table = toTable(records, self.scrapedAt)
+
+        if not self.append:
+            restaurants = set(table.column('restaurant').to_pylist()) - self.replaced
+            for directory in glob.glob(os.path.join(self.path, 'restaurant=*')):
+                if unquote(os.path.basename(directory).split('=', 1)[1]) in restaurants:
+                    shutil.rmtree(directory)
+            self.replaced |= restaurants
+
+        #written into a hidden staging directory (readers skip names starting with '.') and then moved,
+        #so a reader never sees a half written part
+        staging = os.path.join(self.path, f'.staging-{self.token}')
+        pq.write_to_dataset(table, staging, partition_cols=list(PARTITIONS),
+                            basename_template=f'part-{self.token}-{self.part:05d}-{{i}}.parquet')
+        for part in glob.glob(os.path.join(staging, '**', '*.parquet'), recursive=True):
+            target = os.path.join(self.path, os.path.relpath(part, staging))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(part, target)
+        shutil.rmtree(staging, ignore_errors=True)
+        self.part += 1
+        self.count += len(records)
+
+
+#reads only the requested columns (and partitions, for restaurants) of an archive, restaurant comes
+#back categorical; since and until filter on the dined date
+def readArchive(path, columns=None, restaurants=None, since=None, until=None):
+    if not os.path.isdir(path):
+        return pd.DataFrame(columns=columns)
+
+    #partition values are read back dictionary encoded, restaurant arrives in pandas as a categorical
+    dataset = ds.dataset(path, format='parquet', partitioning=ds.HivePartitioning.discover(infer_dictionary=True))
+    condition = None
+    for clause in (
+        ds.field('restaurant').isin(list(restaurants)) if restaurants else None,
+        ds.field('date') >= pa.scalar(pd.Timestamp(since), pa.timestamp('s')) if since is not None else None,
+        ds.field('date') <= pa.scalar(pd.Timestamp(until), pa.timestamp('s')) if until is not None else None,
+    ):
+        if clause is not None:
+            condition = clause if condition is None else condition & clause
+
+    columns = list(columns) if columns else None
+    return dataset.to_table(columns=columns, filter=condition).to_pandas()
+
+
+#the three columns generateReviewsAnalysis reads, under the names of the scraped records
+def reviewsForAnalysis(path, restaurants=None):
+    df = readArchive(path, ['restaurant', 'review', 'date'], restaurants)
+    return pd.DataFrame({
+        'Restaurant Name': df['restaurant'].astype(str),
+        'Review': df['review'],
+        'Date': df['date'].dt.strftime(DATE_FORMAT).fillna('None'),
+    })
+
+
+#restaurants in an archive, from the directory names alone
+def archiveRestaurants(path):
+    names = glob.glob(os.path.join(path, 'restaurant=*'))
+    return sorted(unquote(os.path.basename(name).split('=', 1)[1]) for name in names)
+
+
+#copies a JSON/JSON Lines/CSV file of reviews or analyses into an archive (what convertCSVtoJSON was used for)
+def importFile(source, path, scrapedAt=None):
+    scrapedAt = pd.Timestamp.fromtimestamp(os.path.getmtime(source)) if scrapedAt is None else scrapedAt
+    with ArchiveWriter(path, append=True, scrapedAt=scrapedAt) as writer:
+        writer.write(readRecords(source))
+    return writer.count
+
+
+if __name__ == "__main__":
+    import sys
+
+    #python archive.py reviews.archive restaurant_reviews.csv ...
+    for source in sys.argv[2:]:
+        print(f'{source}: {importFile(source, sys.argv[1])} records archived in {sys.argv[1]}')
@@ -0,0 +1,197 @@
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from batching import packBatches
+from main import MAX_TOKENS, analyzeBatch, normalizeAnalysis
+
+POSITIVE_WORDS = (
+    'amazing', 'attentive', 'awesome', 'beautiful', 'best', 'cozy', 'delicious', 'delightful', 'enjoyed',
+    'excellent', 'exceptional', 'fabulous', 'fantastic', 'favorite', 'fresh', 'friendly', 'good', 'great',
+    'helpful', 'impeccable', 'incredible', 'love', 'loved', 'lovely', 'nice', 'outstanding', 'perfect',
+    'perfectly', 'pleasant', 'polite', 'recommend', 'superb', 'tasty', 'welcoming', 'wonderful', 'yummy',
+)
+NEGATIVE_WORDS = (
+    'awful', 'bad', 'bland', 'burnt', 'cold', 'dirty', 'disappointed', 'disappointing', 'dry', 'greasy',
+    'horrible', 'inattentive', 'mediocre', 'meh', 'noisy', 'overcooked', 'overpriced', 'poor', 'raw',
+    'reheated', 'rude', 'salty', 'slow', 'soggy', 'stale', 'terrible', 'undercooked', 'unfriendly',
+    'unprofessional', 'waited', 'worst',
+)
+
+FOOD_WORDS = (
+    'food', 'dish', 'dishes', 'meal', 'menu', 'appetizer', 'appetizers', 'entree', 'entrees', 'dessert',
+    'desserts', 'brunch', 'breakfast', 'lunch', 'dinner', 'flavor', 'flavors', 'taste', 'tasted', 'portion',
+    'portions', 'steak', 'fish', 'seafood', 'chicken', 'pasta', 'salad', 'soup', 'burger', 'fries', 'pizza',
+    'sushi', 'oysters', 'duck', 'gumbo', 'beignets', 'bread', 'cocktail', 'cocktails', 'wine', 'drinks',
+    'coffee', 'cooked', 'delicious', 'tasty', 'bland', 'salty', 'overcooked', 'undercooked',
+)
+STAFF_WORDS = (
+    'staff', 'service', 'server', 'servers', 'waiter', 'waiters', 'waitress', 'waitstaff', 'bartender',
+    'host', 'hostess', 'manager', 'chef', 'attentive', 'friendly', 'rude', 'polite', 'welcoming',
+    'helpful', 'waited', 'wait', 'seated',
+)
+
+
+def wordPattern(words):
+    return r'\b(?:' + '|'.join(re.escape(word) for word in words) + r')\b'
+
+
+POSITIVE = wordPattern(POSITIVE_WORDS)
+NEGATIVE = wordPattern(NEGATIVE_WORDS)
+#a negator up to two words before a sentiment word flips it ("not good", "wasn't very friendly")
+NEGATED = r"(?:\b(?:not|never|no|hardly|barely)\b|n't)\s+(?:\w+\s+){0,2}?"
+NEGATED_POSITIVE = NEGATED + POSITIVE
+NEGATED_NEGATIVE = NEGATED + NEGATIVE
+FOOD = wordPattern(FOOD_WORDS)
+STAFF = wordPattern(STAFF_WORDS)
+SENTENCE_SPLIT = r'(?<=[.!?;])\s+|\s+(?:but|however)\s+'
+
+
+# interface every analysis backend implements: one record per review, in order, with the
+# review/food_comments/staff_comments/sentiment fields of main.normalizeAnalysis
+class AnalysisBackend:
+
+    name = 'backend'
+    #reviews per analyze() call in main.generateReviewsAnalysis for backends that run locally, None gets the
+    #token budget batches (and the 900 review limit) of the API path
+    chunkSize = None
+
+    def analyze(self, reviews):
+        raise NotImplementedError
+
+
+# the Claude path of main.py: token budget batching, split retries and id-keyed results
+class ClaudeBackend(AnalysisBackend):
+
+    name = 'claude'
+
+    def __init__(self, maxInputTokens=4000, maxReviews=50, mode='json'):
+        self.maxInputTokens = maxInputTokens
+        self.maxReviews = maxReviews
+        self.mode = mode
+        self.usageLog = []
+
+    def analyze(self, reviews):
+        results = []
+        for batch in packBatches(reviews, self.maxInputTokens, MAX_TOKENS, self.maxReviews):
+            try:
+                matched = analyzeBatch(batch, self.usageLog, mode=self.mode)
+            except Exception as e:
+                print("error loading the LLM ", e)
+                matched = [None] * len(batch)
+            results.extend(record or normalizeAnalysis({'review': review}) for review, record in zip(batch, matched))
+        return results
+
+
+#sentences of every review that mention one of the aspect words, joined, 'None' when there are none
+def extractPhrases(series, sentences, pattern):
+    sentences = sentences[sentences.str.contains(pattern, case=False, regex=True, na=False)]
+    #a grouped string sum stays vectorized where ' '.join per group would call back into python
+    phrases = (sentences.str.strip() + ' ').groupby(level=0).sum().str.rstrip()
+    return phrases.reindex(series.index).fillna('None')
+
+
+# local CPU engine: lexicon sentiment scored with vectorized pandas string ops over the whole batch and
+# rule based food/staff phrase extraction, or a transformers sentiment model when model is given
+class LocalBackend(AnalysisBackend):
+
+    name = 'local'
+    chunkSize = 2000
+
+    def __init__(self, model=None, batchSize=32):
+        self.model = model
+        self.batchSize = batchSize
+        self.pipeline = None
+
+    #score in [-1, 1] per review, its magnitude is the confidence
+    def lexiconScores(self, series):
+        lower = series.str.lower()
+        negatedPositive = lower.str.count(NEGATED_POSITIVE)
+        negatedNegative = lower.str.count(NEGATED_NEGATIVE)
+        positive = lower.str.count(POSITIVE) - negatedPositive + negatedNegative
+        negative = lower.str.count(NEGATIVE) - negatedNegative + negatedPositive
+        total = positive + negative
+        score = (positive - negative) / total.where(total > 0, 1)
+        #a single sentiment word is weaker evidence than several agreeing ones
+        return score * (total / 3).clip(upper=1)
+
+    #nlptown/bert-base-multilingual-uncased-sentiment style "1 star".."5 stars" labels mapped to [-1, 1]
+    def modelScores(self, series):
+        if self.pipeline is None:
+            from transformers import pipeline
+            self.pipeline = pipeline('sentiment-analysis', model=self.model)
+
+        outputs = self.pipeline(series.tolist(), batch_size=self.batchSize, truncation=True)
+        scores = []
+        for output in outputs:
+            stars = int(output['label'].split()[0])
+            scores.append((stars - 3) / 2 * output['score'])
+        return pd.Series(scores, index=series.index, dtype=float)
+
+    def analyzeWithScores(self, reviews):
+        series = pd.Series(list(reviews), dtype=str)
+        scores = self.modelScores(series) if self.model else self.lexiconScores(series)
+        sentences = series.str.split(SENTENCE_SPLIT, regex=True).explode()
+        frame = pd.DataFrame({
+            'review': series,
+            'food_comments': extractPhrases(series, sentences, FOOD),
+            'staff_comments': extractPhrases(series, sentences, STAFF),
+            'sentiment': scores.map(lambda score: 'negative' if score < 0 else 'positive'),
+        })
+        return frame.to_dict(orient='records'), scores.tolist()
+
+    def analyze(self, reviews):
+        return self.analyzeWithScores(reviews)[0]
+
+    #the loaded transformers pipeline stays in the process that created it
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['pipeline'] = None
+        return state
+
+
+# local engine first, only reviews it is unsure about (|score| below threshold) go to the LLM
+#generateReviewsAnalysis uses only its local backend and threshold, and sends the escalations through its own API path
+class TriageBackend(AnalysisBackend):
+
+    name = 'triage'
+
+    def __init__(self, local=None, escalate=None, threshold=0.3):
+        self.local = local or LocalBackend()
+        self.escalate = escalate or ClaudeBackend()
+        self.threshold = threshold
+        self.escalated = 0
+
+    def analyze(self, reviews):
+        records, scores = self.local.analyzeWithScores(reviews)
+        ambiguous = [i for i, score in enumerate(scores) if abs(score) < self.threshold]
+        if ambiguous:
+            self.escalated += len(ambiguous)
+            for i, record in zip(ambiguous, self.escalate.analyze([reviews[i] for i in ambiguous])):
+                records[i] = record
+        return records
+
+
+def analyzeChunk(backend, reviews, method='analyze'):
+    return getattr(backend, method)(reviews)
+
+
+#(chunk, result) of every chunk of the reviews, analyzed by a (picklable) backend in a process pool,
+#in input order while the later chunks are still running
+#method='analyzeWithScores' gets (records, scores) of a LocalBackend instead of the records
+def iterParallel(backend, reviews, workers=4, chunkSize=500, method='analyze'):
+    reviews = list(reviews)
+    chunks = [reviews[i: i + chunkSize] for i in range(0, len(reviews), chunkSize)]
+    if workers <= 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            yield chunk, analyzeChunk(backend, chunk, method)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+        yield from zip(chunks, executor.map(analyzeChunk, [backend] * len(chunks), chunks, [method] * len(chunks)))
+
+
+#runs a (picklable) backend over chunks of the reviews in a process pool, results stay in input order
+def analyzeParallel(backend, reviews, workers=4, chunkSize=500):
+    return [record for _, records in iterParallel(backend, reviews, workers, chunkSize) for record in records]
@@ -0,0 +1,72 @@
+from metrics import count
+
+
+#rough token estimate (about 4 characters per token for English text), good enough for budgeting
+def estimateTokens(text):
+    return len(text) // 4 + 1
+
+
+#the model quotes parts of the review for the comments, plus the id, sentiment and JSON around them
+def estimateOutputTokens(review):
+    return int(estimateTokens(review) * 0.6) + 30
+
+
+# packs reviews into batches by estimated input and output tokens instead of a fixed count
+# outputShare keeps headroom under maxOutputTokens since the output estimate is only a guess
+def packBatches(reviews, maxInputTokens=4000, maxOutputTokens=1000, maxReviews=50, outputShare=0.8):
+    outputBudget = maxOutputTokens * outputShare
+    batches = []
+    batch, inputTokens, outputTokens = [], 0, 0
+
+    for review in reviews:
+        reviewInput = estimateTokens(review)
+        reviewOutput = estimateOutputTokens(review)
+        full = (inputTokens + reviewInput > maxInputTokens or outputTokens + reviewOutput > outputBudget
+                or len(batch) >= maxReviews)
+        if batch and full:
+            batches.append(batch)
+            batch, inputTokens, outputTokens = [], 0, 0
+        batch.append(review)
+        inputTokens += reviewInput
+        outputTokens += reviewOutput
+
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+#halves of the reviews that got no usable result, to be sent again as smaller batches
+def splitMissing(reviews, matched):
+    missing = [review for review, record in zip(reviews, matched) if record is None]
+    if len(missing) <= 1:
+        return [missing] if missing else []
+    middle = len(missing) // 2
+    return [missing[:middle], missing[middle:]]
+
+
+def usageRecord(reviews, message):
+    usage = getattr(message, 'usage', None)
+    return {
+        'reviews': len(reviews),
+        'input_tokens': getattr(usage, 'input_tokens', 0) or 0,
+        'output_tokens': getattr(usage, 'output_tokens', 0) or 0,
+        'stop_reason': getattr(message, 'stop_reason', None),
+    }
+
+
+#token usage of a response in the metrics counters (only kept while the instrumentation is on)
+def countUsage(usage):
+    count('llm.requests')
+    count('llm.input_tokens', usage['input_tokens'])
+    count('llm.output_tokens', usage['output_tokens'])
+    if usage['stop_reason'] == 'max_tokens':
+        count('llm.truncated')
+
+
+def summarizeUsage(usageLog):
+    return {
+        'requests': len(usageLog),
+        'input_tokens': sum(u['input_tokens'] for u in usageLog),
+        'output_tokens': sum(u['output_tokens'] for u in usageLog),
+        'truncated': sum(1 for u in usageLog if u['stop_reason'] == 'max_tokens'),
+    }
@@ -0,0 +1,434 @@
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from reviewdates import sampleDates
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BENCH_DIR = os.path.join(HERE, 'benchmarks')
+HISTORY_FILE = os.path.join(BENCH_DIR, 'history.json')
+SIZES = {'1k': 1_000, '100k': 100_000, '1m': 1_000_000}
+RESTAURANT = 'bench-bistro'
+#bump whenever the generated corpus changes, older corpora are then generated again
+CORPUS_VERSION = 1
+
+#a run is a regression when it is this much slower than the median of the last HISTORY_WINDOW runs,
+#and by at least MIN_SLOWDOWN seconds so timer noise on the very fast ones isn't flagged
+TOLERANCE = 0.2
+HISTORY_WINDOW = 5
+MIN_SLOWDOWN = 0.002
+
+DISHES = ('duck confit', 'gumbo', 'steak', 'pasta', 'brunch', 'seafood platter', 'beignets', 'burger',
+          'risotto', 'oysters', 'salmon', 'tacos', 'ramen', 'cheesecake', 'cocktails')
+STAFF = ('server', 'waiter', 'bartender', 'host', 'staff', 'manager')
+FOOD_SENTENCES = {
+    'positive': ('The {} was perfect.', 'Best {} in the city, we will be back.', 'The {} tasted amazing.'),
+    'negative': ('The {} was cold and bland.', 'Our {} came out overcooked.', 'The {} tasted like it was reheated.'),
+}
+STAFF_SENTENCES = {
+    'positive': ('Our {} was friendly and attentive.', 'The {} made great recommendations.'),
+    'negative': ('We waited forty minutes and the {} seemed annoyed.', 'The {} forgot our order twice.'),
+}
+FILLER = ('', '', 'Parking was easy.', 'It was a bit loud on a Friday night.', 'We came for a birthday.')
+
+PAGE_TEMPLATE = '''<!DOCTYPE html>
+<html lang="en">
+<head>
+  <meta charset="utf-8">
+  <title>Bench Bistro - OpenTable (page {page})</title>
+</head>
+<body>
+  <main>
+    <h1>Bench Bistro</h1>
+    <ol id="restProfileReviewsContent">
+{items}
+    </ol>
+{nav}
+  </main>
+</body>
+</html>
+'''
+ITEM_TEMPLATE = '''      <li class="review">
+        <section>
+          <p class="iLkEeQbexGs-">{date}</p>
+          <ol class="ratings">
+            <li>Overall<span>{overall}</span></li>
+            <li>Food<span>{food}</span></li>
+            <li>Service<span>{service}</span></li>
+            <li>Ambience<span>{ambience}</span></li>
+          </ol>
+          <span data-test="wrapper-tag" data-testid="wrapper-tag">{review}</span>
+        </section>
+      </li>'''
+NAV_TEMPLATE = '''    <nav>
+      <a aria-label="Go to the next page" href="page{next}.html" class="">Next</a>
+    </nav>'''
+
+
+def pageName(page):
+    return 'index.html' if page == 1 else f'page{page}.html'
+
+
+def sentences(rng, templates, words, sentiment):
+    choice = rng.integers(0, 1 << 30, len(sentiment))
+    word = np.asarray(words, dtype=object)[rng.integers(0, len(words), len(sentiment))]
+    return [templates[s][c % len(templates[s])].format(w) for s, c, w in zip(sentiment, choice, word)]
+
+
+#reviews the way the scraper stores them, with the analysis the mock LLM would give for each
+def sampleReviews(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    sentiment = np.where(rng.random(rows) < 0.7, 'positive', 'negative')
+    food = sentences(rng, FOOD_SENTENCES, DISHES, sentiment)
+    staff = sentences(rng, STAFF_SENTENCES, STAFF, sentiment)
+    filler = np.asarray(FILLER, dtype=object)[rng.integers(0, len(FILLER), rows)]
+    review = (pd.Series(food) + ' ' + pd.Series(staff) + ' ' + pd.Series(filler)).str.strip()
+    #positive reviews rate 3 to 5, negative ones 1 to 3
+    low = np.where(sentiment == 'positive', 3, 1)[:, None]
+    ratings = low + rng.integers(0, 3, (rows, 4))
+
+    reviews = pd.DataFrame({
+        'Restaurant Name': RESTAURANT,
+        'Review': review,
+        'Date': sampleDates(rows, seed).to_numpy(),
+        'Overall': ratings[:, 0].astype(str), 'Food': ratings[:, 1].astype(str),
+        'Service': ratings[:, 2].astype(str), 'Ambience': ratings[:, 3].astype(str),
+    })
+    analysis = pd.DataFrame({
+        'review': review, 'food_comments': food, 'staff_comments': staff, 'sentiment': sentiment,
+        'restaurant': RESTAURANT, 'date': reviews['Date'],
+    })
+    return reviews, analysis
+
+
+#writes the OpenTable-like pages (perPage reviews each, linked by their next buttons) of rows reviews,
+#the same reviews as reviews.jsonl and their analysis as analysis.jsonl; an existing corpus is reused
+def makeCorpus(rows, directory=None, perPage=50, seed=0):
+    directory = directory or os.path.join(BENCH_DIR, f'corpus-{rows}')
+    spec = {'rows': rows, 'perPage': perPage, 'seed': seed, 'version': CORPUS_VERSION}
+    specPath = os.path.join(directory, 'corpus.json')
+    if os.path.exists(specPath):
+        with open(specPath, 'r', encoding='utf-8') as f:
+            if json.load(f) == spec:
+                return directory
+    shutil.rmtree(directory, ignore_errors=True)
+
+    reviews, analysis = sampleReviews(rows, seed)
+    pagesDir = os.path.join(directory, RESTAURANT)
+    os.makedirs(pagesDir)
+    pages = (rows + perPage - 1) // perPage
+    records = reviews.rename(columns=str.lower).rename(columns={'restaurant name': 'restaurant'})
+    items = [ITEM_TEMPLATE.format(**record) for record in records.to_dict(orient='records')]
+    for page in range(1, pages + 1):
+        nav = NAV_TEMPLATE.format(next=page + 1) if page < pages else ''
+        html = PAGE_TEMPLATE.format(page=page, items='\n'.join(items[(page - 1) * perPage:page * perPage]), nav=nav)
+        with open(os.path.join(pagesDir, pageName(page)), 'w', encoding='utf-8') as f:
+            f.write(html)
+
+    reviews.to_json(os.path.join(directory, 'reviews.jsonl'), orient='records', lines=True, force_ascii=False)
+    analysis.to_json(os.path.join(directory, 'analysis.jsonl'), orient='records', lines=True, force_ascii=False)
+    #written last, a corpus whose generation was interrupted is generated again
+    with open(specPath, 'w', encoding='utf-8') as f:
+        json.dump(spec, f)
+    return directory
+
+
+#keeps the per page and per batch prints of the timed code out of the report
+@contextlib.contextmanager
+def quiet():
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def timed(function, *args, **kwargs):
+    started = time.perf_counter()
+    with quiet():
+        result = function(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+#fastest of repeat runs, for the quick benchmarks whose single runs are mostly noise
+def best(repeat, function, *args, **kwargs):
+    runs = [timed(function, *args, **kwargs) for _ in range(repeat)]
+    return min(runs, key=lambda run: run[0])
+
+
+#scrapReviews over plain HTTP against the corpus pages served on localhost: fetch, parse and pagination
+def benchScrape(directory, rows, perPage=50):
+    from main import scrapReviews
+    from stubserver import serveFixtures
+
+    server, baseUrl = serveFixtures(directory)
+    try:
+        pages = (rows + perPage - 1) // perPage
+        seconds, records = timed(scrapReviews, f'{baseUrl}/{RESTAURANT}/', maxPages=pages, save=False,
+                                 backend='http')
+    finally:
+        server.shutdown()
+        server.server_close()
+    if len(records) != rows:
+        raise RuntimeError(f'scraped {len(records)} of {rows} reviews')
+    return [{'name': 'scrape.http', 'seconds': seconds, 'items': len(records)}]
+
+
+#generateReviewsAnalysis on the concurrent path against the mock Messages API, every request
+#answered after latency seconds; generateReviewsAnalysis analyzes 900 reviews at most whatever the corpus
+def benchAnalyze(directory, latency=0.2, concurrency=4, size=10):
+    import tempfile
+
+    import anthropic
+
+    from main import generateReviewsAnalysis
+    from recordio import loadRecords
+    from stubserver import serveMockMessages
+
+    reviews = loadRecords(os.path.join(directory, 'reviews.jsonl')).head(900)
+    server, baseUrl = serveMockMessages(latency=latency)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'analysis.jsonl')
+            client = anthropic.AsyncAnthropic(base_url=baseUrl, api_key='mock', max_retries=0)
+            seconds, _ = timed(generateReviewsAnalysis, reviews, size, output=output, concurrency=concurrency,
+                               client=client, requestsPerMinute=1_000_000)
+            analysis = loadRecords(output)
+    finally:
+        server.shutdown()
+        server.server_close()
+    #failed batches are written as 'None' analyses, their (fast) timing would mean nothing
+    analyzed = int((analysis['sentiment'] != 'None').sum())
+    if analyzed < len(reviews):
+        raise RuntimeError(f'only {analyzed} of {len(reviews)} reviews were analyzed')
+    return [{'name': f'analyze.mock.{concurrency}x{latency:g}s', 'seconds': seconds, 'items': analyzed}]
+
+
+#the per row convert_review_date against normalizeDates on the scraped date strings
+def benchDates(directory, repeat=3):
+    from recordio import loadRecords
+    from reviewdates import convert_review_date, normalizeDates
+
+    dates = loadRecords(os.path.join(directory, 'reviews.jsonl'), columns=['Date'])['Date']
+    perRow, _ = best(repeat, lambda: pd.to_datetime(dates.apply(convert_review_date)))
+    vectorized, _ = best(repeat, normalizeDates, dates)
+    return [{'name': 'dates.convert_review_date', 'seconds': perRow, 'items': len(dates)},
+            {'name': 'dates.normalizeDates', 'seconds': vectorized, 'items': len(dates)}]
+
+
+SEARCHES = (
+    {'keyword': 'deli'}, {'keyword': 'server'}, {'keyword': 'duck confit'}, {'keyword': 'cold', 'sentiment': 'negative'},
+    {'keyword': '', 'sentiment': 'positive'}, {'keyword': 'steak', 'since': '2021-01-01', 'until': '2022-12-31'},
+)
+
+
+#what app.py does with the analysis file: build its search index once, then count and fetch the first
+#page of review cards for each search
+def benchSearch(directory, pageSize=25, repeat=5):
+    from reviewindex import loadIndex
+
+    source = os.path.join(directory, 'analysis.jsonl')
+    indexPath = source + '.index.db'
+    if os.path.exists(indexPath):
+        os.remove(indexPath)
+    build, index = timed(loadIndex, source, indexPath)
+
+    def searchAll():
+        for search in SEARCHES:
+            search = dict(search)
+            keyword = search.pop('keyword')
+            index.count(keyword, **search)
+            index.search(keyword, limit=pageSize, **search)
+
+    query, _ = best(repeat, searchAll)
+    rows = len(index)
+    index.close()
+    return [{'name': 'search.build', 'seconds': build, 'items': rows},
+            {'name': 'search.query', 'seconds': query / len(SEARCHES), 'items': rows}]
+
+
+DASHBOARDS = ('app.py', 'comparison.py')
+#what the imports of each dashboard may cost at startup, measured with python -X importtime
+#(streamlit alone takes about 0.45s of it; before the heavy imports were made lazy app.py took 1.05s
+#and comparison.py 1.5s)
+IMPORT_BUDGETS = {'app.py': 0.75, 'comparison.py': 0.75}
+
+
+#the top-level import statements of a script, what it loads before its first line of UI runs
+def scriptImports(script):
+    import ast
+
+    with open(os.path.join(HERE, script), 'r', encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    return [ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+
+
+#seconds the imports of a script take in a fresh interpreter, and the cumulative time of every
+#top-level module they loaded (python -X importtime)
+def importTime(script):
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', '\n'.join(scriptImports(script))],
+                            cwd=HERE, capture_output=True, text=True, timeout=120)
+    if result.returncode:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        #nested imports are indented, the header line has no numbers
+        if name.startswith('  ') or not cumulative.strip().isdigit():
+            continue
+        modules[name.strip()] = int(cumulative) / 1e6
+    return sum(modules.values()), modules
+
+
+def benchImports(repeat=3):
+    results = []
+    for script in DASHBOARDS:
+        seconds, modules = min((importTime(script) for _ in range(repeat)), key=lambda run: run[0])
+        heaviest = sorted(modules.items(), key=lambda item: -item[1])[:3]
+        print(f'  {script} imports: ' + ', '.join(f'{name} {cost:.3f}s' for name, cost in heaviest))
+        results.append({'name': f'import.{script}', 'seconds': seconds, 'items': 0,
+                        'budget': IMPORT_BUDGETS.get(script)})
+    return results
+
+
+BENCHMARKS = {
+    'scrape': lambda directory, rows, options: benchScrape(directory, rows),
+    'analyze': lambda directory, rows, options: benchAnalyze(directory, options.get('latency', 0.2)),
+    'dates': lambda directory, rows, options: benchDates(directory),
+    'search': lambda directory, rows, options: benchSearch(directory),
+    'imports': lambda directory, rows, options: benchImports(),
+}
+#the same workload whatever the corpus size, run once per invocation: generateReviewsAnalysis analyzes
+#900 reviews at most and the dashboards' imports don't depend on the data
+ONCE = ('analyze', 'imports')
+
+
+def gitCommit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def loadHistory(path=HISTORY_FILE):
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def saveHistory(history, path=HISTORY_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(history, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+#median of the last window earlier runs of every benchmark and corpus size, the baseline a run is compared to
+def baselines(history, window=HISTORY_WINDOW):
+    seen = {}
+    for run in history:
+        for result in run['results']:
+            seen.setdefault((result['name'], result['size']), []).append(result['seconds'])
+    return {key: statistics.median(values[-window:]) for key, values in seen.items()}
+
+
+#marks every result slower than its baseline by more than tolerance, the results are changed in place
+def flagRegressions(results, history, tolerance=TOLERANCE, window=HISTORY_WINDOW, minSlowdown=MIN_SLOWDOWN):
+    previous = baselines(history, window)
+    regressions = []
+    for result in results:
+        baseline = previous.get((result['name'], result['size']))
+        result['baseline'] = baseline
+        result['regression'] = (baseline is not None and result['seconds'] > baseline * (1 + tolerance)
+                                and result['seconds'] - baseline >= minSlowdown)
+        #a budget is a fixed limit, exceeding it counts whatever the history says
+        result['over_budget'] = result.get('budget') is not None and result['seconds'] > result['budget']
+        result['regression'] = result['regression'] or result['over_budget']
+        if result['regression']:
+            regressions.append(result)
+    return regressions
+
+
+def printResults(results):
+    for result in results:
+        line = f"{result['name']:<28} {result['size']:>5} {result['seconds']:>10.4f}s"
+        if result['items'] and result['seconds']:
+            line += f" {result['items'] / result['seconds']:>12,.0f}/s"
+        if result.get('baseline'):
+            line += f"  {(result['seconds'] / result['baseline'] - 1):+7.1%} vs {result['baseline']:.4f}s"
+        if result.get('over_budget'):
+            line += f"  OVER BUDGET ({result['budget']}s)"
+        elif result.get('regression'):
+            line += '  REGRESSION'
+        print(line)
+
+
+#runs the benchmarks on a corpus of every size, appends the run to the history file (unless record=False)
+#and returns the results, the ones that regressed and the names of the benchmarks that failed
+def runBenchmarks(sizes=('1k', '100k'), benchmarks=tuple(BENCHMARKS), historyPath=HISTORY_FILE, record=True,
+                  tolerance=TOLERANCE, **options):
+    results, failed = [], []
+    done = set()
+    for size in sizes:
+        rows = SIZES[size]
+        started = time.perf_counter()
+        directory = makeCorpus(rows)
+        print(f'corpus {size}: {directory} ({time.perf_counter() - started:.1f}s)')
+        for name in benchmarks:
+            if name in ONCE and name in done:
+                continue
+            done.add(name)
+            try:
+                measured = BENCHMARKS[name](directory, rows, options)
+            except Exception as e:
+                #the other benchmarks still run, nothing is recorded for this one
+                print(f'  {name} failed: {type(e).__name__}: {e}')
+                failed.append(f'{name}@{size}')
+                continue
+            for result in measured:
+                result['size'] = size
+                results.append(result)
+                print(f"  {result['name']}: {result['seconds']:.4f}s")
+
+    history = loadHistory(historyPath)
+    regressions = flagRegressions(results, history, tolerance)
+    printResults(results)
+    if record:
+        history.append({
+            'time': pd.Timestamp.now().isoformat(timespec='seconds'),
+            'commit': gitCommit(),
+            'python': platform.python_version(),
+            'machine': platform.node(),
+            'results': [{key: result[key] for key in ('name', 'size', 'seconds', 'items')} for result in results],
+        })
+        saveHistory(history, historyPath)
+    return results, regressions, failed
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Times scraping, analysis, date parsing and search on synthetic corpora.')
+    parser.add_argument('--sizes', nargs='+', choices=list(SIZES), default=['1k', '100k'])
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument('--latency', type=float, default=0.2, help='seconds the mock LLM takes per request')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    parser.add_argument('--history', default=HISTORY_FILE)
+    parser.add_argument('--no-record', action='store_true', help="don't add this run to the history")
+    args = parser.parse_args()
+
+    results, regressions, failed = runBenchmarks(args.sizes, args.only, args.history, not args.no_record, args.tolerance,
+                                         latency=args.latency)
+    #a non zero exit code so a script (or CI) can stop on a regression or a broken benchmark
+    sys.exit(1 if regressions or failed else 0)
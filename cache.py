@@ -0,0 +1,112 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS analyses (
+    key TEXT PRIMARY KEY,
+    result TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS analyses_last_used ON analyses (last_used);
+'''
+
+
+#same review text regardless of unicode form and whitespace differences
+def normalizeReviewText(text):
+    return re.sub(r'\s+', ' ', unicodedata.normalize('NFC', str(text))).strip()
+
+
+# persistent cache of LLM review analyses, keyed on the normalized review text, prompt version and model
+# least recently used entries are evicted once the stored results pass maxBytes
+class AnalysisCache:
+
+    def __init__(self, path='analysis_cache.db', promptVersion='1', model='', maxBytes=64 * 1024 * 1024):
+        self.path = path
+        self.promptVersion = str(promptVersion)
+        self.model = model
+        self.maxBytes = maxBytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        self.totalBytes = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM analyses').fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def key(self, review):
+        text = '\x1f'.join((self.promptVersion, self.model, normalizeReviewText(review)))
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def get(self, review):
+        key = self.key(review)
+        with self.lock:
+            row = self.conn.execute('SELECT result FROM analyses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            with self.conn:
+                self.conn.execute('UPDATE analyses SET last_used = ? WHERE key = ?', (time.time(), key))
+
+        result = json.loads(row[0])
+        result['review'] = review
+        return result
+
+    def put(self, review, result):
+        data = json.dumps(result, ensure_ascii=False)
+        size = len(data.encode('utf-8'))
+        current = time.time()
+        key = self.key(review)
+
+        with self.lock, self.conn:
+            old = self.conn.execute('SELECT size FROM analyses WHERE key = ?', (key,)).fetchone()
+            self.conn.execute('INSERT OR REPLACE INTO analyses VALUES (?, ?, ?, ?, ?)',
+                              (key, data, size, current, current))
+            self.totalBytes += size - (old[0] if old else 0)
+            if self.totalBytes > self.maxBytes:
+                self.evict()
+
+    #drops least recently used entries until the cache is back under 90% of maxBytes
+    def evict(self):
+        target = self.maxBytes * 0.9
+        rows = self.conn.execute('SELECT key, size FROM analyses ORDER BY last_used').fetchall()
+        stale = []
+        for key, size in rows:
+            if self.totalBytes <= target:
+                break
+            stale.append((key,))
+            self.totalBytes -= size
+        self.conn.executemany('DELETE FROM analyses WHERE key = ?', stale)
+        self.evictions += len(stale)
+
+    def stats(self):
+        with self.lock:
+            entries = self.conn.execute('SELECT COUNT(*) FROM analyses').fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            'entries': entries,
+            'bytes': self.totalBytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+            'evictions': self.evictions,
+        }
@@ -1,131 +1,186 @@
 import streamlit as st
-import pandas as pd
-import matplotlib.pyplot as plt
-from datetime import datetime, timedelta
-import json
-from main import scrapReviews
-
-# Helper function to convert date values (including "Dined today" and "Dined X days ago")
-def convert_review_date(date_str):
-
-    date_str = date_str.strip().lower()
-
-    if date_str == 'dined today':
-        # Current date if it's "Dined today"
-        return datetime.today()  
-
-    # Handle "Dined x days ago"
-    if 'dined' in date_str and 'days ago' in date_str:      
-        days_ago = int(date_str.split()[1]) 
-        return datetime.today() - timedelta(days=days_ago)
-
-    # Handle "Dined x weeks ago"
-    if 'dined' in date_str and 'weeks ago' in date_str:
-        weeks_ago = int(date_str.split()[1])  # The number of weeks ago
-        return datetime.today() - timedelta(weeks=weeks_ago)
-
-    # Handle "Dined x hours ago"
-    if 'dined' in date_str and 'hours ago' in date_str:
-        # The number of hours ago
-        hours_ago = int(date_str.split()[1])  
-        return datetime.today() - timedelta(hours=hours_ago)
-
-    # other standard date formats (e.g., "Jul 12, 2023")
-    try:
-        return datetime.strptime(date_str, '%b %d, %Y') 
-    except ValueError:
-        return None 
-     
+import os
+from jobs import ACTIVE, JobPool, estimateEta, jobKey
+from ratingseries import (CATEGORIES, FREQUENCIES, combineRestaurants, dailyTotals, loadRatings, peerBand,
+                          readManifest, restaurantStats, updateRestaurants)
+
 # Main Dashboard
 st.title("Competitor Analysis: Rating Trends")
 
-st.write("Compare ratings of a restaurant with its competitor over time.")
+st.write("Compare ratings of a restaurant with its competitors over time, and see where it ranks in every category.")
 
-# input fields for competitor url
+# input fields for competitor urls
 st.sidebar.title("Input Restaurants")
 
-competitor_url = st.sidebar.text_input("Enter the competitor's OpenTable link:")
+competitor_urls = [url.strip() for url in st.sidebar.text_area(
+    "Enter the competitors' OpenTable links, one per line:").splitlines() if url.strip()]
 
-# calling the function for scrapping
-if st.sidebar.button("Scrape and Analyze"):
-    with st.spinner("Scraping data..."):
-        #loading the main data of your own restaurant
+# Background workers shared by every session of this server, a scrape keeps going when the page is refreshed
+@st.cache_resource
+def job_pool():
+    return JobPool('jobs.db', workers=2)
+
+pool = job_pool()
+
+# Every restaurant is its own dataset under ratings/, only the restaurants of a changed file are rewritten
+def update_datasets():
+    #the main data of your own restaurant
+    if os.path.exists('restaurant_reviews.json'):
         try:
-            with open('restaurant_reviews.json', 'r', encoding='utf-8') as f:
-                mainData = json.load(f)
-                
+            updateRestaurants('restaurant_reviews.json', main=True)
         except Exception as e:
             st.error(f"Error loading main restaurant data: {e}")
-            mainData = []
-        
-        # Scrape competitor data 
-        competitorData = scrapReviews(competitor_url)
-
-        if mainData and competitorData:
-            #adding another column in the data frame to distinguish between main and competitor restaurant
-            for review in mainData:
-                review['Restaurant'] = 'Main Restaurant'
-            for review in competitorData:
-                review['Restaurant'] = 'Competitor Restaurant'
-
-            # converting into dataframes
-            main_df = pd.DataFrame(mainData)
-
-            competitor_df = pd.DataFrame(competitorData)
-
-            #saving as one data frame
-            combined_data = pd.concat([main_df, competitor_df], ignore_index=True)
-        
-            combined_data.to_csv("ratings_comparison.csv", index=False)
-            
-            st.success("Data scraped successfully!")
-        else:
-            st.error("Failed to scrape data for one or both restaurants.")
 
-# Loading and visualizing the  data
-def makeGraph(rating_cateory,data):
-     # Plot data
-        plt.figure(figsize=(10, 6))
-
-        # Plot for Main Restaurant
-        main_restaurant_data = data[data['Restaurant'] == 'Main Restaurant']
-        plt.plot(main_restaurant_data['Date'], main_restaurant_data[rating_cateory], label='Main Restaurant', color='blue', marker='o')
+    # A comparison file written before the per restaurant datasets existed is imported once
+    if not any(not entry['main'] for entry in readManifest().values()):
+        for legacy_file in ("ratings_comparison.parquet", "ratings_comparison.csv"):
+            if os.path.exists(legacy_file):
+                updateRestaurants(legacy_file)
+                break
+
+# Progress of the running scrapes, polled every second until all of them are finished
+@st.fragment(run_every=1)
+def show_job_progress(job_ids):
+    jobs = [pool.get(job_id) for job_id in job_ids]
+    if all(job['status'] not in ACTIVE for job in jobs):
+        st.rerun()
+
+    for job in jobs:
+        url = job['params'].get('url', job['key'])
+        if job['status'] == 'queued':
+            st.info(f"{url}: scrape queued, waiting for a free worker...")
+        elif job['status'] == 'running':
+            eta = estimateEta(job)
+            text = f"{url}: page {job['done']}, {job['items']} reviews"
+            if eta is not None:
+                text += f", at most {eta:.0f}s left"
+            st.progress(min(job['done'] / (job['total'] or 1), 1.0), text=text)
+
+rescrape = st.sidebar.checkbox("Scrape again even if it was scraped before")
+
+scrape_jobs = st.session_state.setdefault('scrape_jobs', {})
+
+# calling the function for scrapping (as background jobs, the same link is only ever scraped once at a time)
+if st.sidebar.button("Scrape and Analyze"):
+    if competitor_urls:
+        for url in competitor_urls:
+            scrape_jobs[url] = pool.scrape(url, refresh=rescrape)
+    else:
+        st.sidebar.error("Enter at least one competitor's OpenTable link first.")
+
+# A scrape of a listed link started in another session (or before a refresh) is picked up again
+for url in competitor_urls:
+    if url not in scrape_jobs:
+        latest = pool.queue.latest('scrape', jobKey(url))
+        if latest is not None and latest['status'] in ACTIVE:
+            scrape_jobs[url] = latest['id']
+
+compared_jobs = st.session_state.setdefault('compared_jobs', set())
+active_jobs = []
+for url, job_id in scrape_jobs.items():
+    job = pool.get(job_id)
+    if job['status'] in ACTIVE:
+        active_jobs.append(job_id)
+    elif job['status'] == 'failed':
+        st.error(f"Scraping {url} failed: {job['error']}")
+    elif job_id not in compared_jobs:
+        updateRestaurants(job['result'])
+        compared_jobs.add(job_id)
+        st.success(f"Data of {url} scraped successfully!")
+
+if active_jobs:
+    show_job_progress(active_jobs)
+
+update_datasets()
+
+# Daily totals and stats of one restaurant, recomputed only when its dataset's mtime changes
+@st.cache_data(max_entries=1000)
+def load_restaurant(file_path, mtime):
+    ratings = loadRatings(file_path)
+    return dailyTotals(ratings), restaurantStats(ratings)
+
+# Series and ranking of the compared restaurants, keyed on the (path, mtime) of every dataset
+@st.cache_data(max_entries=4)
+def load_comparison(datasets):
+    return combineRestaurants([load_restaurant(file_path, mtime) for file_path, mtime in datasets])
+
+manifest = readManifest()
+main_restaurants = [restaurant for restaurant, entry in manifest.items() if entry['main']]
 
-        # Plot for Competitor Restaurant
-        competitor_data = data[data['Restaurant'] == 'Competitor Restaurant']
-        plt.plot(competitor_data['Date'], competitor_data[rating_cateory], label='Competitor Restaurant', color='red', marker='o')
+# Loading and visualizing the  data
+def makeGraph(rating_cateory, series, band):
+        # Imported on the first chart, starting the dashboard doesn't load matplotlib
+        import matplotlib.pyplot as plt
+
+        fig, ax = plt.subplots(figsize=(10, 6))
+        category_series = series[series['Category'] == rating_cateory]
+
+        # The competitors as one band (middle half of their rolling means) instead of a line each
+        category_band = band[band['Category'] == rating_cateory]
+        if not category_band.empty:
+            ax.fill_between(category_band['Date'], category_band['p25'], category_band['p75'],
+                            color='grey', alpha=0.2, label='Competitors (middle 50%)')
+            ax.plot(category_band['Date'], category_band['median'], color='grey', linestyle='--',
+                    label='Competitors (median)')
+
+        # Period means as points, the rolling mean as the trend line
+        for restaurant, restaurant_series in category_series.groupby('Restaurant', observed=True):
+            color = 'blue' if restaurant in main_restaurants else None
+            line, = ax.plot(restaurant_series['Date'], restaurant_series['rolling_mean'], label=restaurant, color=color)
+            ax.scatter(restaurant_series['Date'], restaurant_series['mean'], color=line.get_color(), s=12, alpha=0.4)
 
         # Customize the plot
-        plt.title(f"{rating_cateory} Trends Over Time")
-        plt.xlabel("Date")
-        plt.ylabel("Rating")
-        plt.legend()
-        plt.grid(True)
+        ax.set_title(f"{rating_cateory} Trends Over Time")
+        ax.set_xlabel("Date")
+        ax.set_ylabel("Rating")
+        ax.legend()
+        ax.grid(True)
 
         # Rotate date labels for better visibility
-        plt.xticks(rotation=45)
+        ax.tick_params(axis='x', labelrotation=45)
 
         # Display the plot using Streamlit
-        st.pyplot(plt)
+        st.pyplot(fig)
+        plt.close(fig)
+
+if not manifest:
+    st.info("No restaurant data yet. Scrape your restaurant and its competitors first.")
+    st.stop()
+
+try:
+    datasets = tuple(sorted((entry['path'], os.path.getmtime(entry['path'])) for entry in manifest.values()))
+    all_series, ranking = load_comparison(datasets)
+except Exception as e:
+    st.error(f"Error loading comparison data: {e}")
+    st.stop()
+
+# Where every restaurant ranks in each category, rank 1 has the best mean rating
+st.subheader(f"Ranking of {len(manifest)} restaurants")
+for tab, category in zip(st.tabs(list(CATEGORIES)), CATEGORIES):
+    category_ranking = ranking[ranking['Category'] == category]
+    tab.dataframe(category_ranking[['rank', 'Restaurant', 'mean', 'median', 'count', 'percentile']],
+                  hide_index=True, width='stretch')
+
+# The main restaurant and the best ranked ones are charted by default, the others only as the competitor band
+overall = ranking[ranking['Category'] == 'Overall']['Restaurant'].tolist()
+default_restaurants = list(dict.fromkeys(main_restaurants + overall[:3]))
+charted = st.multiselect("Restaurants to chart", sorted(manifest), default=default_restaurants)
+
+granularity = st.radio("Granularity", list(FREQUENCIES), index=1, horizontal=True)
 
 if st.button("Visualize Trends"):
+    st.session_state['visualize'] = True
+
+if st.session_state.get('visualize'):
     try:
-        #loading the combined data
-        data = pd.read_csv("ratings_comparison.csv")
-        
-        # Convert 'Date' column to datetime, handling 'Dined today' and 'Dined X days ago'
-        data['Date'] = data['Date'].apply(convert_review_date)
-
-        # Filter out rows where 'Date' is NaT (invalid date)
-        data = data.dropna(subset=['Date'])
-        
+        #the pre-aggregated series of the charted restaurants
+        series = all_series[granularity]
+        band = peerBand(series, exclude=main_restaurants)
+        series = series[series['Restaurant'].isin(charted)]
+
         #making graphs for each rating category
-        makeGraph('Overall',data)
-        makeGraph('Food',data)
-        makeGraph('Service',data)
-        makeGraph('Ambience',data)
+        for category in CATEGORIES:
+            makeGraph(category, series, band)
 
-        
-        
     except Exception as e:
         st.error(f"Error visualizing data: {e}")
@@ -0,0 +1,194 @@
+import json
+import os
+import re
+import time
+
+import lxml.etree
+import lxml.html
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+#where the review markup is found, as XPath (lxml and the browser both evaluate the same expressions)
+#so a renamed class only needs an edit of this file
+SELECTORS_FILE = os.environ.get('REVIEW_SELECTORS', os.path.join(HERE, 'selectors.json'))
+RATING_NAMES = ('Overall', 'Food', 'Service', 'Ambience')
+
+selectorCache = {}
+compiledXPaths = {}
+
+
+#the selector config, read again whenever the file changes
+def loadSelectors(path=SELECTORS_FILE):
+    mtime = os.path.getmtime(path)
+    cached = selectorCache.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, 'r', encoding='utf-8') as f:
+            cached = selectorCache[path] = (mtime, json.load(f))
+    return cached[1]
+
+
+def containerXPath(selectors):
+    container = selectors['container']
+    return f"//{container['tag']}[@id='{container['id']}']"
+
+
+#the markup of the review container alone, cut out of the page without parsing the rest of it
+#(nested elements of the same tag, like the rating lists, are counted to find the matching close tag)
+def sliceContainer(html, tag, id):
+    opening = re.search(rf'<{tag}\b[^>]*\bid\s*=\s*["\']{re.escape(id)}["\']', html, re.IGNORECASE)
+    if opening is None:
+        return None
+
+    depth = 0
+    for match in re.compile(rf'<(/?){tag}\b[^>]*>', re.IGNORECASE).finditer(html, opening.start()):
+        depth += -1 if match.group(1) else 1
+        if depth == 0:
+            return html[opening.start():match.end()]
+    return None
+
+
+#text of a node the way BeautifulSoup's get_text(strip=True) builds it: every piece stripped, then joined
+def nodeText(node):
+    if node is None:
+        return None
+    if isinstance(node, str):
+        return node.strip()
+    return ''.join(piece.strip() for piece in node.itertext())
+
+
+#compiled once per expression, the config only holds a handful of them
+def findAll(node, xpath):
+    compiled = compiledXPaths.get(xpath)
+    if compiled is None:
+        compiled = compiledXPaths[xpath] = lxml.etree.XPath(xpath)
+    return compiled(node)
+
+
+def first(node, xpath):
+    found = findAll(node, xpath)
+    return found[0] if found else None
+
+
+def toRecord(restaurant_name, review, date, ratings):
+    record = {
+        'Restaurant Name': restaurant_name,
+        'Review': review or "No review text found",
+        'Date': date or "No date found",
+    }
+    values = dict(ratings)
+    for name in RATING_NAMES:
+        record[name] = values.get(name) or 'None'
+    return record
+
+
+# same records as main.parseReviewPage, but only the review container is parsed, with lxml,
+# through the selectors of the config file; None when the page has no review container
+def parseReviewPageFast(html, restaurant_name, page_count=1, selectors=None):
+    selectors = selectors or loadSelectors()
+    container = selectors['container']
+
+    fragment = sliceContainer(html, container['tag'], container['id'])
+    if fragment is not None:
+        root = lxml.html.fragment_fromstring(fragment)
+    else:
+        #markup the slicing can't follow, parse the whole page
+        root = first(lxml.html.fromstring(html), containerXPath(selectors))
+        if root is None:
+            return None
+
+    pageReviews = []
+    for i, item in enumerate(findAll(root, selectors['item']), start=1):
+        try:
+            ratings = [(nodeText(first(rating, selectors['ratingName'])), nodeText(first(rating, selectors['ratingValue'])))
+                       for rating in findAll(item, selectors['rating'])]
+            pageReviews.append(toRecord(restaurant_name, nodeText(first(item, selectors['review'])),
+                                        nodeText(first(item, selectors['date'])), ratings))
+        except Exception as e:
+            print(f"Couldn't parse review #{i} on page {page_count}: {e}")
+    return pageReviews
+
+
+#runs in the page: the same XPath config evaluated with document.evaluate, only the extracted strings
+#come back instead of the whole page source
+EXTRACT_SCRIPT = '''
+const selectors = arguments[0];
+const container = arguments[1];
+const all = (xpath, node) => {
+    const found = document.evaluate(xpath, node, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+    return Array.from({length: found.snapshotLength}, (_, i) => found.snapshotItem(i));
+};
+const first = (xpath, node) => all(xpath, node)[0] || null;
+const text = (node) => {
+    if (!node) return null;
+    if (node.nodeType === Node.TEXT_NODE) return node.textContent.trim();
+    const walker = document.createTreeWalker(node, NodeFilter.SHOW_TEXT);
+    let result = '';
+    while (walker.nextNode()) result += walker.currentNode.textContent.trim();
+    return result;
+};
+const root = first(container, document);
+if (!root) return null;
+return all(selectors.item, root).map((item) => [
+    text(first(selectors.review, item)),
+    text(first(selectors.date, item)),
+    all(selectors.rating, item).map((rating) => [
+        text(first(selectors.ratingName, rating)), text(first(selectors.ratingValue, rating))]),
+]);
+'''
+
+
+#extracts the current page in the browser with one execute_script call, None when there is no container
+def extractInBrowser(driver, restaurant_name, selectors=None):
+    selectors = selectors or loadSelectors()
+    items = driver.execute_script(EXTRACT_SCRIPT, selectors, containerXPath(selectors))
+    if items is None:
+        return None
+    return [toRecord(restaurant_name, review, date, ratings) for review, date, ratings in items]
+
+
+#a saved page grown to the size of a real one: the reviews repeated and unrelated markup around them
+def inflatePage(html, selectors, copies=10, padding=500_000):
+    container = selectors['container']
+    fragment = sliceContainer(html, container['tag'], container['id'])
+    opening = fragment[:fragment.index('>') + 1]
+    items = fragment[len(opening):fragment.rindex('<')]
+    filler = '<div class="x"><a href="#">link</a><span>some text</span></div>\n' * (padding // 60)
+    big = f'{opening}{items * copies}</{container["tag"]}>'
+    return html.replace(fragment, f'<script>var state = "{"x" * padding}";</script>{filler}{big}{filler}')
+
+
+#times main.parseReviewPage (BeautifulSoup, whole page) against parseReviewPageFast on saved pages,
+#and checks that both return the same records
+def benchmarkExtraction(paths=None, repeat=20, inflate=True):
+    from main import parseReviewPage
+
+    selectors = loadSelectors()
+    if paths is None:
+        import glob
+        paths = sorted(glob.glob(os.path.join(HERE, 'fixtures', '*', '*.html')))
+
+    results = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            html = f.read()
+        pages = [('saved', html)] + ([('inflated', inflatePage(html, selectors))] if inflate else [])
+        for label, page in pages:
+            timings = {}
+            for name, parse in (('soup', parseReviewPage), ('lxml', parseReviewPageFast)):
+                started = time.perf_counter()
+                for _ in range(repeat):
+                    records = parse(page, 'Benchmark', 1)
+                timings[name] = (time.perf_counter() - started) / repeat
+                timings[name + '_records'] = records
+
+            same = timings['soup_records'] == timings['lxml_records']
+            print(f"{os.path.basename(path)} ({label}, {len(page) // 1024} KB, {len(timings['lxml_records'])} reviews): "
+                  f"soup {timings['soup'] * 1000:.2f} ms, lxml {timings['lxml'] * 1000:.2f} ms "
+                  f"({timings['soup'] / timings['lxml']:.1f}x){'' if same else ', RECORDS DIFFER'}")
+            results.append({'page': path, 'kind': label, 'soup': timings['soup'], 'lxml': timings['lxml'], 'same': same})
+    return results
+
+
+if __name__ == "__main__":
+    import sys
+
+    benchmarkExtraction(sys.argv[1:] or None)
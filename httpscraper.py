@@ -0,0 +1,197 @@
+import json
+import re
+import time
+from datetime import datetime
+from urllib.parse import urljoin
+
+import lxml.html
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from extract import parseReviewPageFast
+from main import extractNameFromURL
+from metrics import observe
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+                  'Chrome/124.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+}
+
+STATE_PATTERNS = (
+    re.compile(r'<script[^>]*id="__NEXT_DATA__"[^>]*>(.*?)</script>', re.S),
+    re.compile(r'window\.__INITIAL_STATE__\s*=\s*(\{.*?\})\s*;?\s*</script>', re.S),
+)
+#the opening tag of main.NEXT_BUTTON, whatever the order of its attributes
+NEXT_LINK = re.compile(r'<a\b[^>]*\baria-label\s*=\s*["\']Go to the next page["\'][^>]*>', re.I)
+
+
+# one session per scrape run, so every page reuses the pooled keep-alive connections
+def createSession(poolSize=10, retries=3, backoff=0.5):
+    session = requests.Session()
+    retry = Retry(total=retries, backoff_factor=backoff,
+                  status_forcelist=(429, 500, 502, 503, 504), allowed_methods=('GET',))
+    adapter = HTTPAdapter(pool_connections=poolSize, pool_maxsize=poolSize, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update(HEADERS)
+    return session
+
+
+def fetchPage(session, url, timeout=20):
+    started = time.perf_counter()
+    response = session.get(url, timeout=timeout)
+    response.raise_for_status()
+    observe('scrape.http_fetch', time.perf_counter() - started)
+    return response.text
+
+
+def extractEmbeddedState(html):
+    for pattern in STATE_PATTERNS:
+        match = pattern.search(html)
+        if match:
+            try:
+                return json.loads(match.group(1))
+            except json.JSONDecodeError:
+                continue
+    return None
+
+
+#walks the embedded state looking for the first list of review objects (text plus a rating block)
+def findReviewList(state):
+    stack = [state]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            if node and all(isinstance(r, dict) and 'text' in r and isinstance(r.get('rating'), dict) for r in node):
+                return node
+            stack.extend(reversed(node))
+        elif isinstance(node, dict):
+            stack.extend(reversed(list(node.values())))
+    return None
+
+
+def formatStateDate(value):
+    if not value:
+        return "No date found"
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).strftime('%b %d, %Y')
+    except ValueError:
+        return str(value)
+
+
+def ratingValue(rating, key):
+    value = rating.get(key)
+    return "None" if value is None else str(value)
+
+
+def parseStateReviews(state, restaurant_name):
+    reviews = findReviewList(state) if state else None
+    if not reviews:
+        return None
+
+    pageReviews = []
+    for review in reviews:
+        rating = review.get('rating', {})
+        text = (review.get('text') or '').strip()
+        pageReviews.append({
+            'Restaurant Name': restaurant_name,
+            'Review': text if text else "No review text found",
+            'Date': formatStateDate(review.get('dinedDateTime') or review.get('submittedDateTimeUTC')),
+            'Overall': ratingValue(rating, 'overall'),
+            'Food': ratingValue(rating, 'food'),
+            'Service': ratingValue(rating, 'service'),
+            'Ambience': ratingValue(rating, 'ambience'),
+        })
+    return pageReviews
+
+
+#only the opening tag of the next page link is parsed, not the whole page
+def nextPageUrl(html, currentUrl):
+    match = NEXT_LINK.search(html)
+    if not match:
+        return None
+    nextButton = lxml.html.fragment_fromstring(match.group(0) + '</a>')
+    if 'disabled' in (nextButton.get('class') or '').split():
+        return None
+    href = nextButton.get('href')
+    if not href or href.startswith('#'):
+        return None
+    return urljoin(currentUrl, href)
+
+
+#same (page number, reviews, page url) pages as main.iterReviewPages, but over plain HTTP without a browser
+def iterReviewPagesHttp(session, url, maxPages=100, startPage=1, startUrl=None):
+    restaurant_name = extractNameFromURL(url)
+    pageUrl = startUrl or url
+    seen = set()
+
+    for page_count in range(startPage if startUrl else 1, maxPages + 1):
+        html = fetchPage(session, pageUrl)
+        seen.add(pageUrl)
+
+        started = time.perf_counter()
+        #the embedded JSON state is preferred, the rendered markup is the fallback
+        pageReviews = parseStateReviews(extractEmbeddedState(html), restaurant_name)
+        if pageReviews is None:
+            pageReviews = parseReviewPageFast(html, restaurant_name, page_count)
+        observe('scrape.parse', time.perf_counter() - started, backend='http')
+
+        if pageReviews is None:
+            #the review list is rendered client side only, nothing to read without a browser
+            if len(seen) == 1:
+                raise ValueError(f'No reviews in the HTML of {url}')
+            print('Reviews not found on the page:', page_count)
+            break
+
+        if not pageReviews:
+            print(f"No review items found on page {page_count}.")
+            break
+
+        yield page_count, pageReviews, pageUrl
+
+        pageUrl = nextPageUrl(html, pageUrl)
+        if not pageUrl or pageUrl in seen:
+            break
+
+
+#runs both backends over the same pages and reports every record that differs
+def compareBackends(url, maxPages=100):
+    from main import scrapReviews
+
+    httpData = scrapReviews(url, maxPages=maxPages, save=False, backend='http')
+    seleniumData = scrapReviews(url, maxPages=maxPages, save=False, backend='selenium')
+
+    mismatches = []
+    for i in range(max(len(httpData), len(seleniumData))):
+        httpRecord = httpData[i] if i < len(httpData) else None
+        seleniumRecord = seleniumData[i] if i < len(seleniumData) else None
+        if httpRecord != seleniumRecord:
+            mismatches.append((i, httpRecord, seleniumRecord))
+    return httpData, seleniumData, mismatches
+
+
+if __name__ == "__main__":
+    import sys
+    from stubserver import serveFixtures
+
+    #parity check of both backends against the saved fixture pages (or the urls given)
+    server = None
+    urls = sys.argv[1:]
+    if not urls:
+        server, baseUrl = serveFixtures()
+        urls = [f'{baseUrl}/fixture-bistro/']
+
+    failed = False
+    for url in urls:
+        httpData, seleniumData, mismatches = compareBackends(url)
+        print(f'{url}: http={len(httpData)} selenium={len(seleniumData)} mismatches={len(mismatches)}')
+        for i, httpRecord, seleniumRecord in mismatches:
+            failed = True
+            print(f'  #{i}\n    http:     {httpRecord}\n    selenium: {seleniumRecord}')
+
+    if server:
+        server.shutdown()
+    sys.exit(1 if failed else 0)
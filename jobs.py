@@ -0,0 +1,292 @@
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlparse, urlunparse
+
+from recordio import detectFormat, lastModified, loadRecords
+from store import now
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    done INTEGER NOT NULL DEFAULT 0,
+    total INTEGER,
+    items INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    created_at TEXT,
+    started_at REAL,
+    updated_at REAL,
+    finished_at REAL,
+    worker INTEGER,
+    heartbeat REAL
+);
+-- at most one queued or running job per kind and key, that is what deduplicates concurrent requests
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_active ON jobs (kind, key) WHERE status IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS jobs_key ON jobs (kind, key, status);
+'''
+
+ACTIVE = ('queued', 'running')
+COLUMNS = ('id', 'kind', 'key', 'params', 'status', 'done', 'total', 'items', 'result', 'error',
+           'created_at', 'started_at', 'updated_at', 'finished_at', 'worker', 'heartbeat')
+#a worker marks its running job every HEARTBEAT seconds, a running job not marked for STALE_AFTER
+#seconds lost its worker and goes back in the queue
+HEARTBEAT = 5
+STALE_AFTER = 30
+
+
+#the same restaurant page always gets the same key, whatever the fragment or trailing slash
+def jobKey(url):
+    parts = urlparse(url.strip())
+    return urlunparse((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip('/'), '', parts.query, ''))
+
+
+def rowToJob(row):
+    job = dict(zip(COLUMNS, row))
+    job['params'] = json.loads(job['params'])
+    return job
+
+
+#seconds left at the current rate, None until there is a rate to go by
+def estimateEta(job):
+    if job['status'] != 'running' or not job['done'] or not job['total'] or not job['started_at']:
+        return None
+    elapsed = (job['updated_at'] or time.time()) - job['started_at']
+    return max(0.0, elapsed / job['done'] * (job['total'] - job['done']))
+
+
+# sqlite job table shared by the dashboards and the worker processes
+class JobQueue:
+
+    def __init__(self, path='jobs.db'):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(SCHEMA)
+        #job tables created before the worker heartbeat existed
+        existing = {row[1] for row in self.conn.execute('PRAGMA table_info(jobs)')}
+        for column, type in (('worker', 'INTEGER'), ('heartbeat', 'REAL')):
+            if column not in existing:
+                self.conn.execute(f'ALTER TABLE jobs ADD COLUMN {column} {type}')
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def query(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def execute(self, sql, params=()):
+        with self.lock, self.conn:
+            return self.conn.execute(sql, params).rowcount
+
+    def get(self, jobId):
+        rows = self.query(f"SELECT {', '.join(COLUMNS)} FROM jobs WHERE id = ?", (jobId,))
+        return rowToJob(rows[0]) if rows else None
+
+    #latest job of a kind and key, reuse=True skips failed ones
+    def latest(self, kind, key, reuse=False):
+        sql = f"SELECT {', '.join(COLUMNS)} FROM jobs WHERE kind = ? AND key = ?"
+        if reuse:
+            sql += " AND status != 'failed'"
+        rows = self.query(sql + ' ORDER BY id DESC LIMIT 1', (kind, key))
+        return rowToJob(rows[0]) if rows else None
+
+    def recent(self, limit=10):
+        rows = self.query(f"SELECT {', '.join(COLUMNS)} FROM jobs ORDER BY id DESC LIMIT ?", (limit,))
+        return [rowToJob(row) for row in rows]
+
+    #id of the job for kind and key: the queued or running one if there is one, the last finished one
+    #unless refresh=True, otherwise a newly queued one
+    def submit(self, kind, key, params, total=None, refresh=False):
+        existing = self.latest(kind, key, reuse=True)
+        if existing is not None and (existing['status'] in ACTIVE or not refresh):
+            return existing['id']
+        try:
+            with self.lock, self.conn:
+                cursor = self.conn.execute(
+                    'INSERT INTO jobs (kind, key, params, total, created_at) VALUES (?, ?, ?, ?, ?)',
+                    (kind, key, json.dumps(params), total, now()))
+            return cursor.lastrowid
+        except sqlite3.IntegrityError:
+            #another session queued the same job in the meantime
+            return self.latest(kind, key)['id']
+
+    #marks the oldest queued job as running by worker (a pid) and returns it, None when the queue is empty
+    #(a single UPDATE, so two workers never get the same job)
+    def claimNext(self, worker=None):
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                """UPDATE jobs SET status = 'running', started_at = ?, updated_at = ?, worker = ?, heartbeat = ?
+                   WHERE id = (SELECT id FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1)
+                   RETURNING id""", (time.time(), time.time(), worker, time.time())).fetchone()
+        return None if row is None else self.get(row[0])
+
+    #the worker is still alive, its running job stays claimed
+    def beat(self, worker):
+        self.execute("UPDATE jobs SET heartbeat = ? WHERE worker = ? AND status = 'running'", (time.time(), worker))
+
+    def progress(self, jobId, done, items=0, total=None):
+        self.execute('UPDATE jobs SET done = ?, items = ?, total = COALESCE(?, total), updated_at = ? WHERE id = ?',
+                     (done, items, total, time.time(), jobId))
+
+    def complete(self, jobId, result):
+        self.execute("UPDATE jobs SET status = 'done', result = ?, finished_at = ?, updated_at = ? WHERE id = ?",
+                     (result, time.time(), time.time(), jobId))
+
+    def fail(self, jobId, error):
+        self.execute("UPDATE jobs SET status = 'failed', error = ?, finished_at = ?, updated_at = ? WHERE id = ?",
+                     (error, time.time(), time.time(), jobId))
+
+    #jobs left running by a worker that went away go back in the queue, scrapes then resume from their checkpoint
+    #(jobs of live workers, e.g. of another server on the same table, keep running where they are)
+    def requeueRunning(self, staleAfter=STALE_AFTER):
+        return self.execute(
+            """UPDATE jobs SET status = 'queued', worker = NULL
+               WHERE status = 'running' AND (heartbeat IS NULL OR heartbeat < ?)""", (time.time() - staleAfter,))
+
+
+#scrapes a restaurant into the review store (resuming an interrupted run) and writes all of its
+#known reviews to a JSON Lines file, which is the job's result
+def scrapeJob(params, progress):
+    from main import extractNameFromURL, scrapReviews
+    from recordio import openWriter
+    from store import ReviewStore
+
+    url = params['url']
+    maxPages = params.get('maxPages', 100)
+    os.makedirs(params.get('outputDir', 'jobs'), exist_ok=True)
+    output = os.path.join(params.get('outputDir', 'jobs'), f'{extractNameFromURL(url)}_reviews.jsonl')
+
+    with ReviewStore(params.get('store', 'reviews.db')) as store:
+        scrapReviews(url, maxPages=maxPages, save=False, backend=params.get('backend', 'selenium'), store=store,
+                     stopAfterKnown=params.get('stopAfterKnown'), resume=True,
+                     onPage=lambda pages, reviews: progress(pages, reviews, maxPages))
+        records = store.reviews(extractNameFromURL(url))
+
+    if not records:
+        raise RuntimeError(f'No reviews found for {url}')
+    with openWriter(output) as writer:
+        writer.write(records)
+    return output
+
+
+#analyzes the reviews of a file (e.g. a scrape job's result), with the local backend when backend='local'
+def analyzeJob(params, progress):
+    from main import generateReviewsAnalysis, openAnalysisCache
+
+    backend = None
+    if params.get('backend') == 'local':
+        from backends import LocalBackend
+        backend = LocalBackend()
+
+    if detectFormat(params['input']) == 'archive':
+        from archive import reviewsForAnalysis
+        reviews = reviewsForAnalysis(params['input'], params.get('restaurants'))
+    else:
+        reviews = loadRecords(params['input'])
+
+    with openAnalysisCache() as cache:
+        generateReviewsAnalysis(reviews, params.get('size', 10), output=params['output'],
+                                cache=cache, backend=backend,
+                                onProgress=lambda written, total: progress(written, written, total))
+    return params['output']
+
+
+HANDLERS = {'scrape': scrapeJob, 'analyze': analyzeJob}
+
+
+#runs one claimed job, its result or error ends up in the job table
+def runJob(queue, job):
+    try:
+        result = HANDLERS[job['kind']](
+            job['params'], lambda done, items=0, total=None: queue.progress(job['id'], done, items, total))
+    except Exception as e:
+        queue.fail(job['id'], f'{type(e).__name__}: {e}')
+        return
+    queue.complete(job['id'], result)
+
+
+#worker process: takes the oldest queued job off the table, polling while there is none,
+#and stops once the process that started it (parentPid) is gone
+#a thread keeps the heartbeat of its running job fresh, while idle it requeues the jobs of dead workers
+def workLoop(path='jobs.db', parentPid=None, idle=0.5):
+    with JobQueue(path) as queue:
+        stopped = threading.Event()
+
+        def heartbeat():
+            while not stopped.wait(HEARTBEAT):
+                queue.beat(os.getpid())
+
+        threading.Thread(target=heartbeat, daemon=True).start()
+        try:
+            while parentPid is None or os.getppid() == parentPid:
+                job = queue.claimNext(os.getpid())
+                if job is None:
+                    queue.requeueRunning()
+                    time.sleep(idle)
+                    continue
+                runJob(queue, job)
+        finally:
+            stopped.set()
+
+
+# worker processes that work through the job table, one set per server: dashboards submit jobs through it
+# and read their progress from the table, so a page refresh or a second session doesn't touch them
+class JobPool:
+
+    def __init__(self, path='jobs.db', workers=2):
+        self.path = path
+        self.queue = JobQueue(path)
+        self.queue.requeueRunning()
+        #separate interpreters, forking a threaded server (streamlit) can deadlock the child
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (HERE, os.environ.get('PYTHONPATH')))))
+        self.workers = [
+            subprocess.Popen([sys.executable, '-m', 'jobs', path, str(os.getpid())], env=env)
+            for _ in range(workers)
+        ]
+
+    def submit(self, kind, key, params, total=None, refresh=False):
+        return self.queue.submit(kind, key, params, total, refresh)
+
+    def scrape(self, url, refresh=False, **params):
+        params = {'url': url, **params}
+        return self.submit('scrape', jobKey(url), params, params.get('maxPages', 100), refresh)
+
+    #an earlier analysis is only reused while the input file is unchanged
+    def analyze(self, input, output, refresh=False, **params):
+        key = f'{os.path.abspath(input)}@{lastModified(input)}'
+        return self.submit('analyze', key, {'input': input, 'output': output, **params}, refresh=refresh)
+
+    def get(self, jobId):
+        return self.queue.get(jobId)
+
+    def close(self):
+        for worker in self.workers:
+            worker.terminate()
+        for worker in self.workers:
+            worker.wait()
+        self.queue.close()
+
+
+if __name__ == "__main__":
+    #python jobs.py [jobs.db] [parent pid] runs one worker
+    workLoop(sys.argv[1] if len(sys.argv) > 1 else 'jobs.db', int(sys.argv[2]) if len(sys.argv) > 2 else None)
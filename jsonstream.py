@@ -0,0 +1,29 @@
+import json
+
+decoder = json.JSONDecoder()
+
+
+#yields every complete element of the first JSON array in text, stopping quietly where the text is cut off
+#(text before the array, like a ```json fence or a sentence from the model, is skipped)
+def iterJsonArray(text):
+    start = text.find('[')
+    if start == -1:
+        return
+
+    index = start + 1
+    length = len(text)
+    while index < length:
+        #skip whitespace and the commas between elements
+        while index < length and text[index] in ' \t\r\n,':
+            index += 1
+        if index >= length or text[index] == ']':
+            return
+        try:
+            element, index = decoder.raw_decode(text, index)
+        except json.JSONDecodeError:
+            return
+        yield element
+
+
+def salvageJsonArray(text):
+    return list(iterJsonArray(text))
@@ -1,19 +1,17 @@
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from bs4 import BeautifulSoup
-import pandas as pd
 import time
-import anthropic
 import json
 import os
+import re
 from urllib.parse import urlparse
+from metrics import count, observe, span, traced
+from recordio import openWriter
+from cache import AnalysisCache
+from jsonstream import salvageJsonArray
+from batching import countUsage, packBatches, splitMissing, summarizeUsage, usageRecord
 
-os.environ["ANTHROPIC_API_KEY"] = ""
-API_KEY = os.getenv("ANTHROPIC_API_KEY")
-if not API_KEY:
-    raise ValueError("API key not found")
+#selenium, bs4, anthropic, pandas and lxml are imported by the functions that use them, so importing this
+#module (the dashboards' job workers, the analyzer, the benchmarks) doesn't pay for all of them up front
+#and nothing is checked at import: the API key is only required once a request is sent (getClient)
 
 def extractNameFromURL(url):
 
@@ -23,258 +21,738 @@ def extractNameFromURL(url):
     return name
 
 
-def scrapReviews(url):
-    driver = webdriver.Chrome()
-    driver.get(url)
+def createDriver(headless=False):
+    from selenium import webdriver
 
-    reviewsData = []
-    page_count = 1
-    restaurant_name = extractNameFromURL(url)
+    options = webdriver.ChromeOptions()
+    if headless:
+        options.add_argument('--headless=new')
+    return webdriver.Chrome(options=options)
 
-    wait = WebDriverWait(driver, 20)
 
-    try:
-        # Loading the reviews container and waiting
-        wait.until(EC.presence_of_element_located((By.XPATH, '//*[@id="restProfileReviewsContent"]')))
-        print("Successfully loaded the Reviews container")
+#BeautifulSoup version of the review extraction, the reference extract.parseReviewPageFast is benchmarked against
+def parseReviewPage(html, restaurant_name, page_count=1):
+    from bs4 import BeautifulSoup
 
-        #main scraping loop
-        for i in range(100):
+    soup = BeautifulSoup(html, 'html.parser')
 
-            try:
-                soup = BeautifulSoup(driver.page_source, 'html.parser')
+    #locating the main reivews container
+    reviewContainer = soup.find('ol', id='restProfileReviewsContent')
+    if not reviewContainer:
+        return None
 
-                #locating the main reivews container
-                reviewContainer = soup.find('ol', id='restProfileReviewsContent')
+    pageReviews = []
 
-                if not reviewContainer:
-                    print('Reviews not found on the page:', page_count)
-                    driver.refresh()
-                    time.sleep(5)
-                    continue
-                
-                #locating the review items from the container 
-                reviewItems = reviewContainer.find_all('li', recursive=False)
-                if not reviewItems:
-                    print(f"No review items found on page {page_count}.")
-                    break
-                
-                #loop to scrap the review items
-                for i, item in enumerate(reviewItems, start=1):
-                    try:
-                        # Extracting review text
-                        reviewText = item.find(
-                            'span',
-                            {'data-test': 'wrapper-tag', 'data-testid': 'wrapper-tag'}
-                        )
-                        reviewText = reviewText.get_text(strip=True) if reviewText else "No review text found"
-                        # print(f"Found review text on page {page_count}")
-
-                        # Extracting ratings
-                        ratingDiv = item.find('ol')
-                        ratings = {'Overall': "None", 'Food': "None", 'Service': "None", 'Ambience': "None"}
-                        
-                        #scraping the values of the ratings 
-                        if ratingDiv:
-                            ratingItems = ratingDiv.find_all('li', recursive=False)
-                            for rItem in ratingItems:
-                                try:
-                                    #scraping overall,food,none etc text
-                                    key = rItem.contents[0].strip()
-                                    #getting the rating value
-                                    value = rItem.find('span').get_text(strip=True)
-                                    ratings[key] = value
-                                except Exception as e:
-                                    print(f"Couldn't process rating item on page {page_count}: {e}")
-
-                        # Extracting review date
-                        reviewDate = item.find('p', class_='iLkEeQbexGs-')
-                        reviewDate = reviewDate.get_text(strip=True) if reviewDate else "No date found"
-
-                        # Appending review data to list
-                        reviewsData.append({
-                            'Restaurant Name': restaurant_name,
-                            'Review': reviewText,
-                            'Date': reviewDate,
-                            'Overall': ratings.get('Overall', 'None'),
-                            'Food': ratings.get('Food', 'None'),
-                            'Service': ratings.get('Service', 'None'),
-                            'Ambience': ratings.get('Ambience', 'None'),
-                        })
+    #locating the review items from the container 
+    reviewItems = reviewContainer.find_all('li', recursive=False)
 
-                    except Exception as e:
-                        print(f"Couldn't parse review #{i} on page {page_count}: {e}")
+    #loop to scrap the review items
+    for i, item in enumerate(reviewItems, start=1):
+        try:
+            # Extracting review text
+            reviewText = item.find(
+                'span',
+                {'data-test': 'wrapper-tag', 'data-testid': 'wrapper-tag'}
+            )
+            reviewText = reviewText.get_text(strip=True) if reviewText else "No review text found"
 
-                # Handling pagination
-                retry = 0
-                #allowing it to retry the click button 3 times
-                while retry < 3:
+            # Extracting ratings
+            ratingDiv = item.find('ol')
+            ratings = {'Overall': "None", 'Food': "None", 'Service': "None", 'Ambience': "None"}
+
+            #scraping the values of the ratings 
+            if ratingDiv:
+                ratingItems = ratingDiv.find_all('li', recursive=False)
+                for rItem in ratingItems:
                     try:
-                        #locating the next page button
-                        nextButton = WebDriverWait(driver, 10).until(EC.element_to_be_clickable((By.XPATH, "//a[@aria-label='Go to the next page']")))
-                        if "disabled" in nextButton.get_attribute("class"):
-                            # print("Last page reached.")
-                            break
-                        #clicking the next page button
-                        nextButton.click()
-                        # print(f"Next button clicked on page {page_count}")
-                        page_count += 1
-                        time.sleep(1)  # Wait for the next page to load
-                        break
+                        #scraping overall,food,none etc text
+                        key = rItem.contents[0].strip()
+                        #getting the rating value
+                        value = rItem.find('span').get_text(strip=True)
+                        ratings[key] = value
                     except Exception as e:
-                        retry += 1
-                        # print(f"Error clicking next button on page {page_count}. Retry {retry}/3: {e}")
-                        if retry == 2:
-                            # print("Retry limit reached. Stopping pagination.")
-                            break
+                        print(f"Couldn't process rating item on page {page_count}: {e}")
+
+            # Extracting review date
+            reviewDate = item.find('p', class_='iLkEeQbexGs-')
+            reviewDate = reviewDate.get_text(strip=True) if reviewDate else "No date found"
+
+            pageReviews.append({
+                'Restaurant Name': restaurant_name,
+                'Review': reviewText,
+                'Date': reviewDate,
+                'Overall': ratings.get('Overall', 'None'),
+                'Food': ratings.get('Food', 'None'),
+                'Service': ratings.get('Service', 'None'),
+                'Ambience': ratings.get('Ambience', 'None'),
+            })
+
+        except Exception as e:
+            print(f"Couldn't parse review #{i} on page {page_count}: {e}")
+
+    return pageReviews
+
+
+REVIEWS_CONTAINER = '//*[@id="restProfileReviewsContent"]'
+FIRST_REVIEW = '#restProfileReviewsContent > li'
+NEXT_BUTTON = "//a[@aria-label='Go to the next page']"
+
+
+#page transition timeout that follows the observed latency (moving average times a safety factor)
+class AdaptiveTimeout:
+
+    def __init__(self, initial=5.0, minimum=1.0, maximum=20.0, factor=4.0, smoothing=0.3):
+        self.average = initial / factor
+        self.minimum = minimum
+        self.maximum = maximum
+        self.factor = factor
+        self.smoothing = smoothing
+
+    def current(self):
+        return min(self.maximum, max(self.minimum, self.average * self.factor))
+
+    def observe(self, seconds):
+        self.average = self.smoothing * seconds + (1 - self.smoothing) * self.average
+
+    #a transition ran out of time, so give the next one more room
+    def expired(self):
+        self.average = min(self.maximum / self.factor, self.average * 2)
+
 
+def firstReview(driver):
+    from selenium.webdriver.common.by import By
+
+    items = driver.find_elements(By.CSS_SELECTOR, FIRST_REVIEW)
+    if not items:
+        return None, None
+    return items[0], items[0].text
+
+
+#true once the first review item went stale (or its text changed) and a new one is rendered
+def firstReviewChanged(oldItem, oldText):
+    from selenium.common.exceptions import StaleElementReferenceException
+    from selenium.webdriver.common.by import By
+
+    def condition(driver):
+        if oldItem is not None:
+            try:
+                if oldItem.text == oldText:
+                    return False
+            except StaleElementReferenceException:
+                pass
+        return len(driver.find_elements(By.CSS_SELECTOR, FIRST_REVIEW)) > 0
+    return condition
+
+
+def goToNextPage(driver, pageWait='event', timeout=None):
+    from selenium.common.exceptions import TimeoutException
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    timeout = timeout or AdaptiveTimeout()
+    retry = 0
+    #allowing it to retry the click button 3 times
+    while retry < 3:
+        try:
+            #locating the next page button
+            nextButton = WebDriverWait(driver, 10).until(EC.element_to_be_clickable((By.XPATH, NEXT_BUTTON)))
+            if "disabled" in (nextButton.get_attribute("class") or ""):
+                # print("Last page reached.")
+                return False
+
+            oldItem, oldText = firstReview(driver)
+            started = time.perf_counter()
+
+            #clicking the next page button
+            nextButton.click()
+        except Exception as e:
+            retry += 1
+            count('scrape.next_retries')
+            # print(f"Error clicking next button. Retry {retry}/3: {e}")
+            continue
+
+        if pageWait == 'sleep':
+            time.sleep(1)  # Wait for the next page to load
+        else:
+            try:
+                WebDriverWait(driver, timeout.current(), poll_frequency=0.05).until(firstReviewChanged(oldItem, oldText))
+                timeout.observe(time.perf_counter() - started)
+            except TimeoutException:
+                #the click went through, so don't click again (that would skip a page)
+                print(f"Page did not change within {timeout.current():.1f}s")
+                count('scrape.page_timeouts')
+                timeout.expired()
+
+        observe('scrape.page_transition', time.perf_counter() - started)
+        return True
+    return False
+
+
+#reloads the page after a failed parse, waiting for the reviews instead of a fixed sleep
+def recoverPage(driver, pageWait='event', timeout=None):
+    from selenium.common.exceptions import TimeoutException
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    timeout = timeout or AdaptiveTimeout()
+    started = time.perf_counter()
+    driver.refresh()
+    if pageWait == 'sleep':
+        time.sleep(5)
+    else:
+        try:
+            WebDriverWait(driver, timeout.maximum, poll_frequency=0.05).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, FIRST_REVIEW)))
+        except TimeoutException:
+            print("Reviews did not reappear after refreshing the page")
+    count('scrape.recoveries')
+    observe('scrape.refresh', time.perf_counter() - started)
+
+
+#yields (page number, reviews, page url) for every page, raises if the reviews container never loads
+#pageWait='event' waits for the first review to change after a click, 'sleep' keeps the old fixed sleeps
+#startPage/startUrl resume from a checkpoint, clicking through the pages when the url doesn't change
+def iterReviewPages(driver, url, maxPages=100, pageWait='event', startPage=1, startUrl=None):
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    from extract import extractInBrowser, parseReviewPageFast
+
+    restaurant_name = extractNameFromURL(url)
+    timeout = AdaptiveTimeout()
+
+    started = time.perf_counter()
+    driver.get(startUrl or url)
+
+    # Loading the reviews container and waiting
+    WebDriverWait(driver, 20).until(EC.presence_of_element_located((By.XPATH, REVIEWS_CONTAINER)))
+    observe('scrape.page_load', time.perf_counter() - started, backend='selenium')
+    print("Successfully loaded the Reviews container")
+
+    page_count = 1
+    if startPage > 1:
+        if startUrl and startUrl != url:
+            page_count = startPage
+        else:
+            while page_count < startPage and goToNextPage(driver, pageWait, timeout):
+                page_count += 1
+
+    #main scraping loop
+    for _ in range(max(maxPages - page_count + 1, 0)):
+        try:
+            started = time.perf_counter()
+            #extracted in the browser, the page source only has to come over when that fails
+            try:
+                pageReviews = extractInBrowser(driver, restaurant_name)
             except Exception as e:
-                print(f"Couldn't process page {page_count}: {e}")
-                driver.refresh()
-                time.sleep(5)
+                print(f"In-browser extraction failed on page {page_count}, parsing the page source: {e}")
+                count('scrape.extract_fallbacks')
+                pageReviews = parseReviewPageFast(driver.page_source, restaurant_name, page_count)
+            observe('scrape.parse', time.perf_counter() - started, backend='selenium')
 
-    except Exception as e:
-        print("Error loading the reviews container.")
-        print(e)
+            if pageReviews is None:
+                print('Reviews not found on the page:', page_count)
+                recoverPage(driver, pageWait, timeout)
+                continue
+
+            if not pageReviews:
+                print(f"No review items found on page {page_count}.")
+                break
+
+            yield page_count, pageReviews, driver.current_url
 
-    driver.quit()
+            # Handling pagination
+            if not goToNextPage(driver, pageWait, timeout):
+                break
+            page_count += 1
+
+        except Exception as e:
+            print(f"Couldn't process page {page_count}: {e}")
+            recoverPage(driver, pageWait, timeout)
 
 
-    file_path = restaurant_name.split()[0].lower()
+#the file is named after the whole restaurant name (the_pink_door_reviews.json), so restaurants sharing
+#a first word ("The Pink Door", "The Walrus") don't overwrite each other's reviews
+def saveReviews(reviewsData, restaurant_name):
+    file_path = re.sub(r'[^a-z0-9]+', '_', restaurant_name.lower()).strip('_') or 'restaurant'
 
     #saving the reviews data in json file
     with open(f'{file_path}_reviews.json', 'w', encoding='utf-8') as file:
         json.dump(reviewsData, file, indent=4)
         print(f'Data saved in {file_path}_reviews.json')
-    return reviewsData
 
-def analyzeReviews(reviews):
-    client = anthropic.Anthropic()
 
-    #joing the reviews from the list as a single string 
-    reviewsText = "\n".join([f"Review: {review} \n" for review in reviews])
+#consumes a page iterator into reviewsData (or only into writer when reviewsData is None),
+#checkpointing every page in the store when one is given
+#stops early once stopAfterKnown reviews in a row were already in the store
+#relative dates ("Dined 3 days ago") are stored as absolute ones, resolved against anchor (the start of the scrape),
+#the store matches reviews on the days their scraped dates can stand for, so one that went from "Dined 6 days ago"
+#to "Dined 1 week ago" or to its absolute date is still known
+#onPage(pages, reviews) is called after every page with the running totals, e.g. to report progress
+def collectPages(pageIter, url, reviewsData, store=None, stopAfterKnown=None, writer=None, anchor=None, onPage=None):
+    from reviewdates import absoluteDates, anchorTime, dateRanges
+
+    anchor = anchorTime(anchor)
+    pages = 0
+    reviews = 0
+    knownStreak = 0
+    for page_count, pageReviews, pageUrl in pageIter:
+        scrapedDates = [review['Date'] for review in pageReviews]
+        pageReviews = absoluteDates(pageReviews, anchor)
+        if reviewsData is not None:
+            reviewsData.extend(pageReviews)
+        if writer is not None:
+            with span('io.write', records=len(pageReviews)):
+                writer.write(pageReviews)
+        pages += 1
+        reviews += len(pageReviews)
+        count('scrape.pages')
+        count('scrape.reviews', len(pageReviews))
+        if onPage is not None:
+            onPage(pages, reviews)
+        if store is None:
+            continue
+
+        with span('store.checkpoint', page=page_count):
+            added = store.addPage(url, page_count, pageReviews, pageUrl, dateRanges(scrapedDates, anchor))
+        for isNew in added:
+            knownStreak = 0 if isNew else knownStreak + 1
+
+        if stopAfterKnown and knownStreak >= stopAfterKnown:
+            print(f"Found {knownStreak} already stored reviews in a row on page {page_count}, stopping.")
+            break
+
+    if store is not None:
+        store.finish(url)
+    return pages
+
+
+#passes the pages of a page iterator on, state['page'] is the last one the consumer finished
+#(also when the iterator fails on the next one)
+def trackPages(pageIter, state):
+    for page in pageIter:
+        yield page
+        state['page'] = page[0]
+
+
+#backend='http' reads the pages without a browser and falls back to selenium when it finds nothing
+#with a store (store.ReviewStore) every page is checkpointed, resume=True continues an interrupted run
+#with output (a .json/.jsonl/.csv/.parquet path) every page is streamed to disk instead of kept in memory,
+#and the output path is returned instead of the records
+@traced('scrape.run')
+def scrapReviews(url, driver=None, maxPages=100, save=True, pageWait='event', backend='selenium',
+                 store=None, stopAfterKnown=None, resume=False, output=None, onPage=None):
+    from reviewdates import anchorTime
+
+    restaurant_name = extractNameFromURL(url)
+    writer = openWriter(output, append=resume) if output else None
+    reviewsData = None if writer is not None else []
+    pages = 0
+    #one anchor for every page, also when the http backend falls back to selenium
+    anchor = anchorTime()
+
+    startPage, startUrl = store.resumePoint(url) if store is not None and resume else (1, None)
+    if startPage > 1:
+        print(f"Resuming {restaurant_name} from page {startPage}")
+
+    try:
+        if backend == 'http':
+            from httpscraper import createSession, iterReviewPagesHttp
+            session = createSession()
+            done = {'page': None}
+            try:
+                pageIter = trackPages(iterReviewPagesHttp(session, url, maxPages, startPage, startUrl), done)
+                pages = collectPages(pageIter, url, reviewsData, store, stopAfterKnown, writer, anchor, onPage)
+            except Exception as e:
+                print(f"HTTP scraping failed, falling back to selenium: {e}")
+            finally:
+                session.close()
+            #the pages already read over http are kept, selenium continues after the last one
+            if not pages and done['page'] is not None:
+                startPage, startUrl = done['page'] + 1, None
+
+        if not pages:
+            #a driver can be passed in (e.g. from the browser pool) and is then left open
+            ownDriver = driver is None
+            if ownDriver:
+                driver = createDriver()
+
+            try:
+                pageIter = iterReviewPages(driver, url, maxPages, pageWait, startPage, startUrl)
+                collectPages(pageIter, url, reviewsData, store, stopAfterKnown, writer, anchor, onPage)
+
+            except Exception as e:
+                print("Error loading the reviews container.")
+                print(e)
+
+            if ownDriver:
+                driver.quit()
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if writer is not None:
+        print(f'Streamed {writer.count} reviews to {output}')
+        return output
+
+    if save:
+        #with a store the file gets everything known about the restaurant, not only this run's pages
+        saveReviews(store.reviews(restaurant_name) if store is not None else reviewsData, restaurant_name)
+    return reviewsData
+
+MODEL = "claude-3-5-sonnet-20241022"
+#bump whenever the prompt or the output format changes, cached analyses of older versions are then ignored
+PROMPT_VERSION = 2
+MAX_TOKENS = 1000
+SYSTEM_PROMPT = "You are an assistant trained to analyze my restaurant's customer reviews about the food and staff."
+
+client = None
+sampling = None
+
+
+#the key is only needed (and checked) once something is actually sent to the API
+def requireApiKey():
+    if not os.getenv("ANTHROPIC_API_KEY"):
+        raise ValueError("API key not found")
+
+
+#one client for the whole process so the http connections are reused between batches
+def getClient():
+    global client
+    if client is None:
+        import anthropic
+
+        requireApiKey()
+        client = anthropic.Anthropic()
+    return client
+
+
+#short per-batch ids the model answers with, so nothing has to be matched back by review text
+def reviewIds(reviews):
+    return [f"r{i}" for i in range(1, len(reviews) + 1)]
+
+
+ANALYSIS_TOOL = {
+    'name': 'record_review_analyses',
+    'description': 'Record the food, staff/service and sentiment analysis of every review, keyed by the review id.',
+    'input_schema': {
+        'type': 'object',
+        'properties': {
+            'analyses': {
+                'type': 'array',
+                'items': {
+                    'type': 'object',
+                    'properties': {
+                        'id': {'type': 'string'},
+                        'food_comments': {'type': 'string'},
+                        'staff_comments': {'type': 'string'},
+                        'sentiment': {'type': 'string', 'enum': ['positive', 'negative']},
+                    },
+                    'required': ['id', 'food_comments', 'staff_comments', 'sentiment'],
+                },
+            },
+        },
+        'required': ['analyses'],
+    },
+}
+
+
+#mode='json' asks for a JSON array in the text (salvageable when cut off), mode='tool' for a forced tool call
+def buildPrompt(reviews, mode='json'):
+    #joing the reviews from the list as a single string, each with its id
+    reviewsText = "\n".join([f"[{id}] {review}" for id, review in zip(reviewIds(reviews), reviews)])
+
+    if mode == 'tool':
+        outputFormat = f"Record the analysis of every review with the {ANALYSIS_TOOL['name']} tool."
+    else:
+        outputFormat = """Your response should be only a JSON array with one element per review, in the order of the reviews. The format should be like this:
+    [
+        {"id": "r1", "food_comments": "Exact feedback on food quality (or 'None' if not mentioned).", "staff_comments": "Exact feedback on staff/service (or 'None' if not mentioned).", "sentiment": "positive"},
+        ...
+    ]"""
 
     #main prompt 
-    prompt = f"""
-    Analyze the following customer reviews. For each review, provide feedback on:
+    return f"""
+    Analyze the following customer reviews. Each review starts with its id in square brackets. For each review, provide feedback on:
     1. Food quality (if mentioned), using the exact wording from the review.
     2. Staff/service (if mentioned), using the exact wording from the review.
     3. Overall sentiment of the review, categorizing it as either **positive** or **negative** based on the tone and content of the review. This sentiment must be provided in the response for each review.
 
     The analysis should be done **individually** for each review. For each review, respond with the following:
-    - The original review text.
+    - The review id (do not repeat the review text).
     - Feedback on food quality, using the exact words from the review (or 'None' if not mentioned).
     - Feedback on staff/service, using the exact words from the review (or 'None' if not mentioned).
     - A **positive/negative sentiment field** which should be explicitly marked as **positive** if the overall tone of the review is favorable, and **negative** if it is unfavorable.
 
-    Your response should be formatted as a JSON array with each element corresponding to one review. The format should be like this:
-    [
-        {{
-            "review": "Original review text here.",
-            "food_comments": "Exact feedback on food quality (or 'None' if not mentioned).",
-            "staff_comments": "Exact feedback on staff/service (or 'None' if not mentioned).",
-            "sentiment": "positive" or "negative" based on the tone of the review.
-        }},
-        ...
-    ]
+    {outputFormat}
 
     Reviews:
-    {reviewsText}
+{reviewsText}
     """
 
-    response = None
-    try:
-        message = client.messages.create(
-    
-        model="claude-3-5-sonnet-20241022",
-        max_tokens=1000,
-        temperature=0,
-        system="You are an assistant trained to analyze my restaurant's customer reviews about the food and staff.",
-        messages=[
-                {
-                    "role": "user",
-                    "content": prompt #providing the main prompt to the api
-                }
-            ]
-            )
-        #getting the response content text from the api response
-        response = message.content[0].text
-        try:
-            #saving the response text as json format
-            results = json.loads(response)
-            # print('After loading response is: ', results)
-            resultsDict = []
-
-            #now saving each analysis of the response as a dictionary in a list
-            for review in results:
-                reviewText = review.get('review','')
-                foodComments = review.get('food_comments', '').strip()
-                staffComments = review.get('staff_comments', "").strip()
-                sentiment = review.get('sentiment','').strip()
-
-                dict = {
-                    'review' : reviewText,
-                    'food_comments' : foodComments if foodComments else 'None',
-                    'staff_comments' : staffComments if staffComments else 'None',
-                    'sentiment' : sentiment if sentiment else 'None'
-                }
-                resultsDict.append(dict)
-            # print(resultsDict)
-
-            return resultsDict
-
-
-        except (json.JSONDecodeError, TypeError) as e:
-            print(f"Error decoding response: {e}")
-            return {}
-        
-    except json.JSONDecodeError as e:
-        print("Error in the LLM")
-        return {} 
-    except Exception as e:
-        print("error loading the LLM ",e)
-        return {}
-    # return json.loads(message['completion'])
-
-def generateReviewsAnalysis(reviewsData, size):
-
-    analysisData = []
-
-    reviewsList = reviewsData['Review'].to_list()
 
-    #at max 900 reviews will be scrapped
-    length = (900 if len(reviewsList) > 900 else len(reviewsList))
+#anthropic releases whose messages.create no longer takes temperature reject it, it is only sent where accepted
+def samplingParams():
+    global sampling
+    if sampling is None:
+        import inspect
+
+        from anthropic.resources.messages import Messages
+        sampling = {'temperature': 0} if 'temperature' in inspect.signature(Messages.create).parameters else {}
+    return sampling
+
+
+def messageParams(reviews, maxTokens=MAX_TOKENS, mode='json'):
+    params = {
+        'model': MODEL,
+        'max_tokens': maxTokens,
+        **samplingParams(),
+        'system': SYSTEM_PROMPT,
+        'messages': [
+            {
+                "role": "user",
+                "content": buildPrompt(reviews, mode) #providing the main prompt to the api
+            }
+        ],
+    }
+    if mode == 'tool':
+        params['tools'] = [ANALYSIS_TOOL]
+        params['tool_choice'] = {'type': 'tool', 'name': ANALYSIS_TOOL['name']}
+    return params
+
+
+#every complete element of the answer, even when the array was cut off by max_tokens
+def parseAnalysis(response):
+    resultsDict = []
+
+    #now saving each analysis of the response as a dictionary in a list
+    for review in salvageJsonArray(response):
+        if not isinstance(review, dict):
+            continue
+        foodComments = str(review.get('food_comments') or '').strip()
+        staffComments = str(review.get('staff_comments') or '').strip()
+        sentiment = str(review.get('sentiment') or '').strip()
+
+        result = {
+            'id' : str(review.get('id', '')).strip(),
+            'food_comments' : foodComments if foodComments else 'None',
+            'staff_comments' : staffComments if staffComments else 'None',
+            'sentiment' : sentiment if sentiment else 'None'
+        }
+        resultsDict.append(result)
+
+    return resultsDict
+
+
+#the analyses in a response, from the forced tool call or from the JSON array in the text
+def responseAnalysis(message):
+    for block in message.content:
+        if getattr(block, 'type', None) == 'tool_use':
+            analyses = (block.input or {}).get('analyses') or []
+            return parseAnalysis(json.dumps(analyses))
+    return parseAnalysis(''.join(getattr(block, 'text', '') for block in message.content))
 
-    for i in range(0, length, size):
-        #we will send reviews as batches of size to save api tokens
-        reviews = reviewsList[i: i+size]
-        try:         
-            analysis = analyzeReviews(reviews)
 
-            print('done')
-
-            analysisData.extend(analysis)
-
-        except Exception as e:
-            print(f"Error analyzing the review")
-
-            analysisData.append({
-                    'Review': reviews,
-                    'Food_Comments': 'None',
-                    'Staff_Comments': 'None'
-            })
+def analyzeReviews(reviews):
+    try:
+        message = getClient().messages.create(**messageParams(reviews))
+        return [record for record in readAnalysis(reviews, message) if record is not None]
 
-    df = pd.DataFrame(analysisData)
+    except Exception as e:
+        print("error loading the LLM ",e)
+        return {}
 
-    df = df.fillna('None')
-    jDict = df.to_dict(orient='records')
 
-    with open('reviews_analysis.json', 'w', encoding='utf-8') as jFile:
-        json.dump(jDict, jFile, indent=4)
-    print('saved analysis in reviews_analysis.json')
+ANALYSIS_FIELDS = ('review', 'food_comments', 'staff_comments', 'sentiment')
+
+
+#every analysis record gets all the fields the dashboard reads, missing ones as 'None'
+def normalizeAnalysis(record):
+    return {field: record.get(field) or 'None' for field in ANALYSIS_FIELDS}
+
+
+#lines the model's answers up with the batch's reviews by id, None for reviews without an answer
+def matchAnalyses(reviews, analysis):
+    byId = {record['id']: record for record in analysis}
+    matched = []
+    for id, review in zip(reviewIds(reviews), reviews):
+        record = byId.get(id)
+        matched.append(None if record is None else normalizeAnalysis({**record, 'review': review}))
+    return matched
+
+
+#results for the batch's reviews from one API response, None where nothing usable came back
+def readAnalysis(reviews, message):
+    with span('llm.decode', reviews=len(reviews)):
+        matched = matchAnalyses(reviews, responseAnalysis(message))
+    missing = sum(1 for record in matched if record is None)
+    if missing:
+        count('llm.unmatched_reviews', missing)
+        print(f"No usable result for {missing} of {len(reviews)} reviews ({message.stop_reason})")
+    return matched
+
+
+def printUsage(usage):
+    print(f"batch of {usage['reviews']}: {usage['input_tokens']} input / {usage['output_tokens']} output tokens ({usage['stop_reason']})")
+
+
+#sends a batch and re-sends (in halves) only the reviews whose results were truncated or unparseable,
+#a single review that still runs out of tokens is retried with a bigger output budget
+def analyzeBatch(reviews, usageLog=None, maxTokens=MAX_TOKENS, mode='json'):
+    with span('llm.request', reviews=len(reviews), max_tokens=maxTokens):
+        message = getClient().messages.create(**messageParams(reviews, maxTokens, mode))
+    usage = usageRecord(reviews, message)
+    countUsage(usage)
+    printUsage(usage)
+    if usageLog is not None:
+        usageLog.append(usage)
+
+    matched = readAnalysis(reviews, message)
+    if len(reviews) == 1:
+        if matched[0] is None and usage['stop_reason'] == 'max_tokens' and maxTokens < MAX_TOKENS * 4:
+            return analyzeBatch(reviews, usageLog, maxTokens * 2, mode)
+        return matched
+
+    results = dict(zip(reviews, matched))
+    for part in splitMissing(reviews, matched):
+        results.update(zip(part, analyzeBatch(part, usageLog, maxTokens, mode)))
+    return [results[review] for review in reviews]
+
+
+def openAnalysisCache(path='analysis_cache.db', maxBytes=64 * 1024 * 1024):
+    return AnalysisCache(path, promptVersion=PROMPT_VERSION, model=MODEL, maxBytes=maxBytes)
+
+
+#each batch is written to output (.json/.jsonl/.csv/.parquet) as soon as it is analyzed, in input order
+#concurrency > 1 runs the batches through the async engine in analyzer.py (options go to AsyncAnalyzer)
+#with a cache (openAnalysisCache()) only reviews that were never analyzed before are sent
+#batches hold at most size reviews and are packed to stay within maxInputTokens and MAX_TOKENS of output
+#mode='tool' asks for the results through a forced tool call instead of a JSON array in the text
+#backend (see backends.py, e.g. LocalBackend() or TriageBackend()) replaces the Claude calls, the cache
+#then only serves earlier Claude results and nothing new is added to it
+#a local backend (one with a chunkSize) gets every review, in chunks of chunkSize over workers processes
+#a TriageBackend runs its local backend the same way and sends the reviews it is unsure about through the
+#API path below (at most 900 of them, cached and counted like any other run), the others keep the local analysis
+#onProgress(written, total) is called whenever more reviews have been written to output
+@traced('analyze.run')
+def generateReviewsAnalysis(reviewsData, size, output='reviews_analysis.json', concurrency=1, cache=None,
+                            maxInputTokens=4000, mode='json', backend=None, onProgress=None, workers=4,
+                            **analyzerOptions):
+    triage = backend if getattr(backend, 'name', None) == 'triage' else None
+    local = triage.local if triage is not None else backend
+    chunkSize = getattr(local, 'chunkSize', None)
+
+    #at max 900 reviews will be sent to the API, a local backend analyzes all of them
+    if not chunkSize:
+        reviewsData = reviewsData.head(900) if hasattr(reviewsData, 'head') else list(reviewsData)[:900]
+    #a DataFrame (anything with to_dict), or a list of records
+    records = reviewsData.to_dict(orient='records') if hasattr(reviewsData, 'to_dict') else list(reviewsData)
+    reviewsList = [r['Review'] for r in records]
+    length = len(reviewsList)
+
+    #restaurant and date of every review are written along with its analysis so the dashboard can filter on them
+    context = [{'restaurant': r.get('Restaurant Name') or 'None', 'date': r.get('Date') or 'None'} for r in records]
+
+    resolved = {}
+    if cache is not None:
+        for review in dict.fromkeys(reviewsList):
+            cached = cache.get(review)
+            if cached is not None:
+                resolved[review] = cached
+        print(f'{len(resolved)} reviews found in the analysis cache')
+        count('cache.hits', len(resolved))
+
+    #we will send reviews as batches to save api tokens, repeated reviews only once
+    toSend = [review for review in dict.fromkeys(reviewsList) if review not in resolved]
+    batches = [] if chunkSize else packBatches(toSend, maxInputTokens, MAX_TOKENS, maxReviews=size)
+
+    written = 0
+    usageLog = []
+    #only Claude's results go into the cache, the local ones of a triage run are kept for when Claude fails
+    fromClaude = backend is None
+    localRecords = {}
+
+    with openWriter(output) as writer:
+
+        #writes every review from the last written position on that already has its analysis
+        def writeResolved():
+            nonlocal written
+            start = written
+            while written < length and reviewsList[written] in resolved:
+                written += 1
+            if written > start:
+                with span('io.write', records=written - start):
+                    writer.write([{**resolved[review], **context[i]} for i, review in enumerate(reviewsList[start:written], start)])
+                if onProgress is not None:
+                    onProgress(written, length)
+
+        def saveBatch(reviews, matched):
+            if any(matched):
+                print('done')
+            else:
+                print(f"Error analyzing the review")
+
+            for review, record in zip(reviews, matched):
+                if record is None:
+                    resolved[review] = localRecords.get(review) or normalizeAnalysis({'review': review})
+                    continue
+                resolved[review] = record
+                if cache is not None and fromClaude:
+                    cache.put(review, record)
+            writeResolved()
+
+        writeResolved()
+
+        if chunkSize and triage is None:
+            from backends import iterParallel
+            for reviews, matched in iterParallel(backend, toSend, workers, chunkSize):
+                saveBatch(reviews, matched)
+        elif chunkSize:
+            from backends import iterParallel
+            for reviews, (matched, scores) in iterParallel(local, toSend, workers, chunkSize, 'analyzeWithScores'):
+                confident = []
+                for review, record, score in zip(reviews, matched, scores):
+                    if abs(score) < triage.threshold and len(localRecords) < 900:
+                        localRecords[review] = record
+                    else:
+                        confident.append((review, record))
+                if confident:
+                    saveBatch([review for review, _ in confident], [record for _, record in confident])
+
+            print(f'{len(localRecords)} reviews escalated to Claude')
+            triage.escalated += len(localRecords)
+            count('triage.escalated', len(localRecords))
+            batches = packBatches(list(localRecords), maxInputTokens, MAX_TOKENS, maxReviews=size)
+            fromClaude = True
+        elif backend is not None:
+            for reviews in batches:
+                saveBatch(reviews, backend.analyze(reviews))
+
+        if fromClaude and concurrency > 1:
+            from analyzer import analyzeBatches
+            analyzeBatches(batches, saveBatch, usageLog, concurrency=concurrency, mode=mode, **analyzerOptions)
+        elif fromClaude:
+            #a missing API key stops the run here instead of failing every batch
+            if batches:
+                getClient()
+            for reviews in batches:
+                try:
+                    saveBatch(reviews, analyzeBatch(reviews, usageLog, mode=mode))
+                except Exception as e:
+                    print("error loading the LLM ", e)
+                    saveBatch(reviews, [None] * len(reviews))
+
+    print('token usage:', summarizeUsage(usageLog))
+    if cache is not None:
+        print('analysis cache:', cache.stats())
+    print(f'saved analysis in {output}')
 
 
 def convertCSVtoJSON(csv_file_path, json_path):
+    import pandas as pd
 
     try:
         df = pd.read_csv(csv_file_path)
@@ -0,0 +1,340 @@
+import atexit
+import bisect
+import contextvars
+import itertools
+import json
+import math
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# upper bounds (seconds) of the latency buckets, the last bucket catches everything slower
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, math.inf)
+
+
+class LatencyHistogram:
+
+    def __init__(self, name, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self.lock:
+            self.counts[min(index, len(self.counts) - 1)] += 1
+            self.count += 1
+            self.total += seconds
+            self.min = seconds if self.min is None else min(self.min, seconds)
+            self.max = seconds if self.max is None else max(self.max, seconds)
+
+    #approximate percentile, reported as the upper bound of the bucket it falls in
+    def percentile(self, p):
+        with self.lock:
+            if not self.count:
+                return None
+            rank = p / 100 * self.count
+            seen = 0
+            for bound, count in zip(self.buckets, self.counts):
+                seen += count
+                if seen >= rank:
+                    return self.max if math.isinf(bound) else min(bound, self.max)
+            return self.max
+
+    def snapshot(self):
+        with self.lock:
+            count, total = self.count, self.total
+            buckets = {('+Inf' if math.isinf(b) else b): c for b, c in zip(self.buckets, self.counts)}
+            low, high = self.min, self.max
+        return {
+            'count': count,
+            'sum': round(total, 6),
+            'mean': round(total / count, 6) if count else None,
+            'min': low,
+            'max': high,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'buckets': buckets,
+        }
+
+    def reset(self):
+        with self.lock:
+            self.counts = [0] * len(self.buckets)
+            self.count = 0
+            self.total = 0.0
+            self.min = None
+            self.max = None
+
+
+class Counter:
+
+    def __init__(self, name):
+        self.name = name
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def reset(self):
+        with self.lock:
+            self.value = 0
+
+
+histograms = {}
+counters = {}
+registryLock = threading.Lock()
+
+
+def getHistogram(name):
+    histogram = histograms.get(name)
+    if histogram is None:
+        with registryLock:
+            histogram = histograms.setdefault(name, LatencyHistogram(name))
+    return histogram
+
+
+def getCounter(name):
+    counter = counters.get(name)
+    if counter is None:
+        with registryLock:
+            counter = counters.setdefault(name, Counter(name))
+    return counter
+
+
+def snapshot(prefix=''):
+    return {name: h.snapshot() for name, h in sorted(histograms.items()) if name.startswith(prefix)}
+
+
+def counterValues(prefix=''):
+    return {name: c.value for name, c in sorted(counters.items()) if name.startswith(prefix)}
+
+
+def printHistograms(prefix=''):
+    for name, data in snapshot(prefix).items():
+        if not data['count']:
+            continue
+        print(f"{name}: n={data['count']} total={data['sum']:.2f}s mean={data['mean']:.3f}s "
+              f"p50<={data['p50']:.3f}s p95<={data['p95']:.3f}s max={data['max']:.3f}s")
+
+
+#instrumentation (spans, counters, events) is off unless REVIEW_METRICS is set or enable() is called:
+#REVIEW_METRICS=1 keeps the metrics in memory, REVIEW_METRICS=<file>.jsonl also appends every event to that file
+#while it is off span() hands out one shared no-op object and count() returns right away
+enabled = os.environ.get('REVIEW_METRICS', '') not in ('', '0')
+eventsPath = os.environ.get('REVIEW_METRICS') if os.environ.get('REVIEW_METRICS', '').endswith('.jsonl') else None
+eventsFile = None
+eventsLock = threading.Lock()
+currentSpan = contextvars.ContextVar('currentSpan', default=None)
+spanIds = itertools.count(1)
+
+
+#turns the instrumentation on, with events appended to eventsTo (a .jsonl path) when given
+def enable(eventsTo=None):
+    global enabled, eventsPath
+    enabled = True
+    if eventsTo is not None:
+        closeEvents()
+        eventsPath = eventsTo
+
+
+def disable():
+    global enabled
+    enabled = False
+    closeEvents()
+
+
+def closeEvents():
+    global eventsFile
+    with eventsLock:
+        if eventsFile is not None:
+            eventsFile.close()
+            eventsFile = None
+
+
+#one JSON line per event, the file is opened on the first one and gets a final snapshot at exit
+def emit(event):
+    global eventsFile
+    if eventsPath is None:
+        return
+    line = json.dumps({'time': round(time.time(), 6), 'pid': os.getpid(), **event}, default=str) + '\n'
+    with eventsLock:
+        if eventsFile is None:
+            eventsFile = open(eventsPath, 'a', encoding='utf-8', buffering=1)
+            atexit.register(writeSnapshot)
+        eventsFile.write(line)
+
+
+def count(name, amount=1):
+    if not enabled:
+        return
+    getCounter(name).inc(amount)
+
+
+#a duration measured by the caller: always kept in the histogram (the scrape reports read them),
+#also an event while the instrumentation is on
+def observe(name, seconds, **labels):
+    getHistogram(name).observe(seconds)
+    if enabled:
+        emit({'type': 'timer', 'name': name, 'seconds': round(seconds, 6), **({'labels': labels} if labels else {})})
+
+
+class NullSpan:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **labels):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+# timed block: its duration goes into the histogram of its name and, with an events file, a span event
+# that links to the span it was opened in (also across await, the parent is kept in a context variable)
+class Span:
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.id = next(spanIds)
+        self.parent = None
+        self.token = None
+        self.started = None
+
+    def __enter__(self):
+        parent = currentSpan.get()
+        self.parent = parent.id if parent is not None else None
+        self.token = currentSpan.set(self)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, excType, exc, tb):
+        seconds = time.perf_counter() - self.started
+        currentSpan.reset(self.token)
+        getHistogram(self.name).observe(seconds)
+        if excType is not None:
+            count(self.name + '.errors')
+        emit({'type': 'span', 'name': self.name, 'id': self.id, 'parent': self.parent, 'seconds': round(seconds, 6),
+              'labels': self.labels, 'error': excType.__name__ if excType is not None else None})
+        return False
+
+    #labels only known inside the block, e.g. the number of reviews parsed
+    def set(self, **labels):
+        self.labels.update(labels)
+
+
+def span(name, **labels):
+    if not enabled:
+        return NULL_SPAN
+    return Span(name, labels)
+
+
+#runs every call of the decorated function in a span of the given name
+def traced(name):
+    def decorate(function):
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            with Span(name, {}):
+                return function(*args, **kwargs)
+        wrapper.__name__ = function.__name__
+        wrapper.__doc__ = function.__doc__
+        wrapper.__wrapped__ = function
+        return wrapper
+    return decorate
+
+
+def writeSnapshot():
+    emit({'type': 'snapshot', 'counters': counterValues(), 'histograms': snapshot()})
+
+
+def metricName(name):
+    return 'review_' + ''.join(c if c.isalnum() else '_' for c in name)
+
+
+#the counters and histograms in the Prometheus text exposition format
+def prometheusText():
+    lines = []
+    for name, value in counterValues().items():
+        metric = metricName(name) + '_total'
+        lines += [f'# TYPE {metric} counter', f'{metric} {value}']
+    for name, data in snapshot().items():
+        metric = metricName(name) + '_seconds'
+        lines.append(f'# TYPE {metric} histogram')
+        cumulative = 0
+        for bound, bucketCount in data['buckets'].items():
+            cumulative += bucketCount
+            lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+        lines += [f'{metric}_sum {data["sum"]}', f'{metric}_count {data["count"]}']
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        data = prometheusText().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+#serves prometheusText() at http://127.0.0.1:<port>/metrics for a Prometheus scraper, turns the instrumentation on
+def serveMetrics(port=9464, host='127.0.0.1'):
+    enable()
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    host, port = server.server_address
+    return server, f'http://{host}:{port}/metrics'
+
+
+#cost of an instrumented block and a counter with the instrumentation off and on, in nanoseconds
+#(no events are written while it measures)
+def measureOverhead(calls=1_000_000):
+    global enabled, eventsPath
+    was, path = enabled, eventsPath
+    eventsPath = None
+    results = {}
+    try:
+        for state in (False, True):
+            enabled = state
+            started = time.perf_counter()
+            for _ in range(calls):
+                with span('overhead.check'):
+                    pass
+            spanCost = (time.perf_counter() - started) / calls * 1e9
+            started = time.perf_counter()
+            for _ in range(calls):
+                count('overhead.check')
+            counterCost = (time.perf_counter() - started) / calls * 1e9
+            results['on' if state else 'off'] = {'span_ns': round(spanCost), 'count_ns': round(counterCost)}
+    finally:
+        enabled, eventsPath = was, path
+        histograms.pop('overhead.check', None)
+        counters.pop('overhead.check', None)
+    return results
+
+
+if __name__ == "__main__":
+    print(measureOverhead())
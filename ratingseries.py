@@ -0,0 +1,246 @@
+import json
+import os
+from urllib.parse import quote
+
+from recordio import lastModified
+
+#pandas is imported by the functions, comparison.py only needs the constants until there is something to chart
+CATEGORIES = ('Overall', 'Food', 'Service', 'Ambience')
+#pandas offset aliases of the series the trend charts can show
+FREQUENCIES = {'Daily': 'D', 'Weekly': 'W', 'Monthly': 'MS'}
+#one typed ratings file per compared restaurant, plus sources.json recording what each was built from
+RATINGS_DIR = 'ratings'
+
+
+#typed comparison data: categorical restaurant, timestamps and ratings as numbers ('None' and other
+#non numbers become nulls), converted one column at a time
+def typedRatings(data, anchor=None):
+    import pandas as pd
+
+    from reviewdates import normalizeDates
+
+    #dates of a typed file are timestamps already
+    dates = data['Date'] if pd.api.types.is_datetime64_any_dtype(data['Date']) else normalizeDates(data['Date'], anchor)
+    ratings = pd.DataFrame({'Restaurant': data['Restaurant'].astype('category'), 'Date': dates})
+    for category in CATEGORIES:
+        ratings[category] = pd.to_numeric(data[category], errors='coerce').round().astype('Int8') if category in data else pd.NA
+    return ratings
+
+
+#the combined reviews of the compared restaurants as a typed parquet file
+def saveRatings(data, path='ratings_comparison.parquet'):
+    typedRatings(data).to_parquet(path, index=False)
+
+
+#only the restaurant, date and rating columns of a comparison file (.parquet or the older .csv)
+def loadRatings(path='ratings_comparison.parquet'):
+    import pandas as pd
+
+    columns = ('Restaurant', 'Date') + CATEGORIES
+    if path.endswith('.parquet'):
+        ratings = pd.read_parquet(path, columns=list(columns))
+    else:
+        data = pd.read_csv(path, dtype=str, keep_default_na=False, usecols=lambda column: column in columns)
+        #relative dates of older files are resolved against the time the file was written
+        ratings = typedRatings(data, pd.Timestamp.fromtimestamp(os.path.getmtime(path)))
+    for category in CATEGORIES:
+        ratings[category] = ratings[category].astype('float64')
+    return ratings.dropna(subset=['Date'])
+
+
+#per restaurant and day: the sum and the number of the ratings of every category, the only pass over all reviews
+def dailyTotals(ratings):
+    categories = [category for category in CATEGORIES if category in ratings]
+    grouped = ratings.groupby(['Restaurant', ratings['Date'].dt.normalize()], observed=True)[categories]
+    return grouped.sum(min_count=1).fillna(0), grouped.count()
+
+
+# rolls the daily totals up into one row per restaurant, period and category: the mean rating, how many
+# ratings it is based on, and a rolling mean over the last window periods weighted by those counts
+def aggregateRatings(totals, freq='W', window=4):
+    import numpy as np
+    import pandas as pd
+
+    #one column per category and restaurant, so a single resample and rolling window cover every restaurant
+    #(resample fills the periods without reviews, so the rolling window counts periods and not rows)
+    sums = totals[0].unstack('Restaurant').resample(freq).sum()
+    counts = totals[1].unstack('Restaurant').resample(freq).sum()
+    rollingSums = sums.rolling(window, min_periods=1).sum()
+    rollingCounts = counts.rolling(window, min_periods=1).sum()
+
+    #the columns are every category x restaurant pair, so the frames reshape into period x category x restaurant
+    #arrays and flatten restaurant first, without stacking the MultiIndex
+    restaurants = counts.columns.levels[1][counts.columns.codes[1][:counts.columns.levshape[1]]]
+    categories = list(totals[1].columns)
+    shape = (len(counts), len(categories), len(restaurants))
+
+    def flat(values):
+        return values.reshape(shape).transpose(2, 0, 1).ravel()
+
+    countValues = counts.to_numpy().reshape(shape)
+    #every restaurant keeps only the periods from its first to its last review
+    reviewed = countValues.sum(axis=1) > 0
+    active = np.logical_or.accumulate(reviewed) & np.logical_or.accumulate(reviewed[::-1])[::-1]
+    keep = np.broadcast_to(active[:, None, :], shape).transpose(2, 0, 1).ravel()
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        means = np.where(countValues > 0, sums.to_numpy().reshape(shape) / countValues, np.nan)
+        rollingCountValues = rollingCounts.to_numpy().reshape(shape)
+        rollingMeans = np.where(rollingCountValues > 0, rollingSums.to_numpy().reshape(shape) / rollingCountValues, np.nan)
+
+    series = pd.DataFrame({
+        'Restaurant': restaurants.repeat(shape[0] * shape[1]),
+        'Date': np.tile(counts.index.repeat(shape[1]), shape[2]),
+        'Category': np.tile(categories, shape[0] * shape[2]),
+        'mean': flat(means),
+        'count': flat(countValues).astype('int64'),
+        'rolling_mean': flat(rollingMeans),
+    })
+    return series[keep].reset_index(drop=True)
+
+
+#daily, weekly and monthly series of a comparison file, keyed like FREQUENCIES
+def ratingSeries(path='ratings_comparison.parquet', window=4):
+    totals = dailyTotals(loadRatings(path))
+    return {name: aggregateRatings(totals, freq, window) for name, freq in FREQUENCIES.items()}
+
+
+def datasetPath(directory, restaurant):
+    return os.path.join(directory, quote(restaurant, safe=' ') + '.parquet')
+
+
+#restaurant -> {'source', 'mtime', 'main', 'path'} of every restaurant in a ratings directory
+def readManifest(directory=RATINGS_DIR):
+    try:
+        with open(os.path.join(directory, 'sources.json'), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def writeManifest(manifest, directory=RATINGS_DIR):
+    path = os.path.join(directory, 'sources.json')
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+# writes the typed ratings of every restaurant in a review file (a scrape result, restaurant_reviews.json or an
+# older ratings_comparison file) to its own dataset; a file that is unchanged since it was last read is skipped,
+# so only restaurants with new data are rewritten. Returns the restaurants that were written
+def updateRestaurants(source, directory=RATINGS_DIR, main=False):
+    import pandas as pd
+
+    from recordio import loadRecords
+
+    manifest = readManifest(directory)
+    sourcePath, mtime = os.path.abspath(source), lastModified(source)
+    if any(entry['source'] == sourcePath and entry['mtime'] == mtime for entry in manifest.values()):
+        return []
+
+    data = loadRecords(source)
+    if data.empty:
+        return []
+    #scraped records name their restaurant, the older comparison files only have the chart label
+    data['Restaurant'] = data['Restaurant Name'] if 'Restaurant Name' in data else data['Restaurant']
+    anchor = None if source.endswith('.parquet') else pd.Timestamp.fromtimestamp(os.path.getmtime(source))
+    ratings = typedRatings(data, anchor)
+
+    os.makedirs(directory, exist_ok=True)
+    written = []
+    for restaurant, restaurantRatings in ratings.groupby('Restaurant', observed=True):
+        path = datasetPath(directory, restaurant)
+        restaurantRatings.to_parquet(path + '.tmp', index=False)
+        os.replace(path + '.tmp', path)
+        previous = manifest.get(restaurant, {})
+        manifest[restaurant] = {'source': sourcePath, 'mtime': mtime, 'path': path,
+                                'main': main or previous.get('main', False)}
+        written.append(restaurant)
+    writeManifest(manifest, directory)
+    return written
+
+
+#per restaurant and category: number of ratings, mean and quartiles, one groupby over the long ratings
+def restaurantStats(ratings):
+    categories = [category for category in CATEGORIES if category in ratings]
+    long = ratings.melt(id_vars='Restaurant', value_vars=categories, var_name='Category', value_name='Rating')
+    grouped = long.dropna(subset=['Rating']).groupby(['Restaurant', 'Category'], observed=True)['Rating']
+    stats = grouped.agg(['count', 'mean'])
+    quartiles = grouped.quantile([0.25, 0.5, 0.75]).unstack()
+    stats[['p25', 'median', 'p75']] = quartiles.to_numpy()
+    return stats.reset_index()
+
+
+# where every restaurant stands in each category: rank 1 is the best mean rating, percentile is the share of
+# compared restaurants whose mean is at most this one's
+def rankRestaurants(stats):
+    stats = stats.copy()
+    means = stats.groupby('Category', observed=True)['mean']
+    stats['rank'] = means.rank(ascending=False, method='min').astype(int)
+    stats['percentile'] = (means.rank(pct=True, method='max') * 100).round(1)
+    stats['restaurants'] = means.transform('size')
+    return stats.sort_values(['Category', 'rank'], ignore_index=True)
+
+
+# the rating series and the ranking of the compared restaurants from their per restaurant parts:
+# parts holds (dailyTotals, restaurantStats) of each restaurant, so a restaurant whose data didn't change
+# is never read or grouped again, only the small per day totals are concatenated and rolled up
+def combineRestaurants(parts, window=4):
+    import pandas as pd
+
+    sums = pd.concat([totals[0] for totals, _ in parts])
+    counts = pd.concat([totals[1] for totals, _ in parts])
+    series = {name: aggregateRatings((sums, counts), freq, window) for name, freq in FREQUENCIES.items()}
+    ranking = rankRestaurants(pd.concat([stats for _, stats in parts], ignore_index=True))
+    return series, ranking
+
+
+#quartiles of the other restaurants' rolling means for every category and period, the band a restaurant
+#is drawn against instead of one line per competitor
+def peerBand(series, exclude=()):
+    import pandas as pd
+
+    peers = series[~series['Restaurant'].isin(list(exclude))]
+    if peers.empty:
+        return pd.DataFrame(columns=['Category', 'Date', 'p25', 'median', 'p75'])
+    band = peers.groupby(['Category', 'Date'], observed=True)['rolling_mean'].quantile([0.25, 0.5, 0.75]).unstack()
+    band.columns = ['p25', 'median', 'p75']
+    return band.reset_index()
+
+
+#times building the comparison of restaurants x reviews synthetic ratings, from scratch and with one
+#restaurant changed (the others' parts come from the cache, as in the dashboard)
+def benchmarkComparison(restaurants=25, reviews=2000, seed=0):
+    import time
+
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    rows = restaurants * reviews
+    ratings = pd.DataFrame({
+        'Restaurant': pd.Categorical([f'Restaurant {i:02d}' for i in range(restaurants) for _ in range(reviews)]),
+        'Date': pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 730, rows), unit='D'),
+    })
+    for category in CATEGORIES:
+        ratings[category] = rng.integers(1, 6, rows).astype('float64')
+
+    started = time.perf_counter()
+    parts = [(dailyTotals(group), restaurantStats(group)) for _, group in ratings.groupby('Restaurant', observed=True)]
+    combineRestaurants(parts)
+    full = time.perf_counter() - started
+
+    started = time.perf_counter()
+    changed = ratings[ratings['Restaurant'] == 'Restaurant 00']
+    parts[0] = (dailyTotals(changed), restaurantStats(changed))
+    combineRestaurants(parts)
+    refresh = time.perf_counter() - started
+
+    print(f'{restaurants} restaurants x {reviews} reviews: full build {full:.3f}s, one restaurant changed {refresh:.3f}s')
+    return {'full': full, 'refresh': refresh}
+
+
+if __name__ == "__main__":
+    import sys
+
+    benchmarkComparison(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,230 @@
+import csv
+import glob
+import json
+import os
+
+FORMATS = {
+    '.json': 'json',
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+    '.csv': 'csv',
+    '.parquet': 'parquet',
+    #typed parquet dataset partitioned by restaurant and scrape date, see archive.py
+    '.archive': 'archive',
+}
+
+
+def detectFormat(path):
+    return FORMATS.get(os.path.splitext(path.rstrip('/\\'))[1].lower(), 'jsonl')
+
+
+#modification time of a file, or of the newest part in a parquet directory or archive
+def lastModified(path):
+    if os.path.isdir(path):
+        parts = glob.glob(os.path.join(path, '**', 'part-*.parquet'), recursive=True)
+        return max((os.path.getmtime(part) for part in parts), default=os.path.getmtime(path))
+    return os.path.getmtime(path)
+
+
+# base class for the streaming writers, every write() call ends up on disk before it returns
+class RecordWriter:
+
+    def __init__(self, path, durable=False):
+        self.path = path
+        self.durable = durable
+        self.count = 0
+        self.file = None
+
+    def write(self, records):
+        raise NotImplementedError
+
+    def flush(self):
+        if self.file is None:
+            return
+        self.file.flush()
+        if self.durable:
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class JsonLinesWriter(RecordWriter):
+
+    def __init__(self, path, durable=False, append=False):
+        super().__init__(path, durable)
+        self.file = open(path, 'a' if append else 'w', encoding='utf-8')
+
+    def write(self, records):
+        for record in records:
+            self.file.write(json.dumps(record, ensure_ascii=False))
+            self.file.write('\n')
+            self.count += 1
+        self.flush()
+
+
+# streams a pretty printed JSON array (the format the dashboards already read) one batch at a time
+class JsonArrayWriter(RecordWriter):
+
+    def __init__(self, path, durable=False, append=False):
+        super().__init__(path, durable)
+        self.empty = True
+        end = -1
+        if append and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                text = f.read()
+            end = text.rfind('\n    }')
+        if end == -1:
+            self.file = open(path, 'w', encoding='utf-8')
+            self.file.write('[')
+        else:
+            #reopens the array after its last complete item, the closing bracket is written again on close
+            os.truncate(path, len(text[:end + len('\n    }')].encode('utf-8')))
+            self.file = open(path, 'a', encoding='utf-8')
+            self.empty = False
+
+    def write(self, records):
+        for record in records:
+            item = json.dumps(record, indent=4).replace('\n', '\n    ')
+            self.file.write(('\n    ' if self.empty else ',\n    ') + item)
+            self.empty = False
+            self.count += 1
+        self.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.write(']' if self.empty else '\n]')
+        super().close()
+
+
+class CsvWriter(RecordWriter):
+
+    def __init__(self, path, durable=False, append=False):
+        super().__init__(path, durable)
+        self.writeHeader = not (append and os.path.exists(path) and os.path.getsize(path) > 0)
+        self.file = open(path, 'a' if append else 'w', encoding='utf-8', newline='')
+        self.writer = None
+
+    def write(self, records):
+        for record in records:
+            if self.writer is None:
+                self.writer = csv.DictWriter(self.file, fieldnames=list(record), extrasaction='ignore')
+                if self.writeHeader:
+                    self.writer.writeheader()
+            self.writer.writerow(record)
+            self.count += 1
+        self.flush()
+
+
+# parquet has its footer at the end, so the output is a directory of small closed part files
+# (one per write) that stays readable while the run is still going
+class ParquetWriter(RecordWriter):
+
+    def __init__(self, path, durable=False, append=False):
+        super().__init__(path, durable)
+        os.makedirs(path, exist_ok=True)
+        parts = glob.glob(os.path.join(path, 'part-*.parquet'))
+        if not append:
+            #a new run replaces the parts of the previous one instead of adding to them
+            for part in parts:
+                os.remove(part)
+            parts = []
+        self.part = len(parts)
+
+    def write(self, records):
+        if not records:
+            return
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        partPath = os.path.join(self.path, f'part-{self.part:05d}.parquet')
+        pq.write_table(pa.Table.from_pylist(records), partPath + '.tmp')
+        #rename so a reader never sees a half written part
+        os.replace(partPath + '.tmp', partPath)
+        self.part += 1
+        self.count += len(records)
+
+
+def openWriter(path, format=None, durable=False, append=False):
+    format = format or detectFormat(path)
+    if format == 'jsonl':
+        return JsonLinesWriter(path, durable, append)
+    if format == 'json':
+        return JsonArrayWriter(path, durable, append)
+    if format == 'csv':
+        return CsvWriter(path, durable, append)
+    if format == 'parquet':
+        return ParquetWriter(path, durable, append)
+    if format == 'archive':
+        from archive import ArchiveWriter
+        return ArchiveWriter(path, durable, append)
+    raise ValueError(f'Unknown output format: {format}')
+
+
+#a JSON array that is still being written has no closing bracket, close it after the last full item
+def loadPartialJsonArray(text):
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+
+    end = text.rfind('\n    }')
+    if end == -1:
+        return []
+    return json.loads(text[:end + len('\n    }')] + '\n]')
+
+
+def readRecords(path, format=None):
+    format = format or detectFormat(path)
+
+    if format == 'json':
+        with open(path, 'r', encoding='utf-8') as f:
+            return loadPartialJsonArray(f.read())
+
+    if format == 'jsonl':
+        records = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    #last line of a file that is still being written
+                    break
+        return records
+
+    if format == 'csv':
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            return list(csv.DictReader(f))
+
+    if format in ('parquet', 'archive'):
+        return loadRecords(path, format).to_dict(orient='records')
+
+    raise ValueError(f'Unknown input format: {format}')
+
+
+def loadRecords(path, format=None, columns=None):
+    import pandas as pd
+
+    format = format or detectFormat(path)
+    if format == 'archive':
+        from archive import readArchive
+        return readArchive(path, columns)
+    if format == 'parquet':
+        parts = sorted(glob.glob(os.path.join(path, 'part-*.parquet'))) if os.path.isdir(path) else [path]
+        if not parts:
+            return pd.DataFrame(columns=columns)
+        return pd.concat([pd.read_parquet(p, columns=columns) for p in parts], ignore_index=True)
+    if format == 'csv':
+        return pd.read_csv(path, usecols=columns, dtype=str, keep_default_na=False)
+
+    df = pd.DataFrame(readRecords(path, format))
+    return df[columns] if columns else df
@@ -0,0 +1,156 @@
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+#the format the scrapers store dates in ("Jul 12, 2023")
+DATE_FORMAT = '%b %d, %Y'
+#full month names ("Dined on July 12, 2023") are parsed as well
+DATE_FORMATS = (DATE_FORMAT, '%B %d, %Y')
+
+RELATIVE = r'^(?:dined\s+)?(?P<count>\d+|an?|one)\s+(?P<unit>minute|hour|day|week|month|year)s?\s+ago$'
+TODAY = r'^(?:dined\s+)?(?:today|just now)$'
+YESTERDAY = r'^(?:dined\s+)?yesterday$'
+WORD_COUNTS = {'a': '1', 'an': '1', 'one': '1'}
+#units with a fixed length, months and years go through DateOffset since their length varies
+FIXED_UNITS = {'minute': 'min', 'hour': 'h', 'day': 'D', 'week': 'W'}
+#"Dined 2 weeks ago" reads the same for days, so the date it resolves to is only known to a span of days
+COARSE_UNITS = ('week', 'month', 'year')
+
+
+def anchorTime(anchor=None):
+    return pd.Timestamp.now() if anchor is None else pd.Timestamp(anchor)
+
+
+#resolves the date strings of the reviews into timestamps, the relative ones ("Dined today",
+#"Dined 3 days ago", "Dined 2 months ago") against one anchor so a whole run agrees on what "today" is
+#every distinct string is only parsed once (dates repeat a lot), unknown ones become NaT
+def normalizeDates(dates, anchor=None):
+    anchor = anchorTime(anchor)
+    series = pd.Series(dates, dtype=object)
+    unique = pd.Series(series.dropna().unique(), dtype=object)
+    text = unique.astype(str).str.strip()
+    lower = text.str.lower()
+
+    resolved = pd.Series(pd.NaT, index=unique.index, dtype='datetime64[ns]')
+    resolved[lower.str.match(TODAY)] = anchor
+    resolved[lower.str.match(YESTERDAY)] = anchor - pd.Timedelta(days=1)
+
+    parts = lower.str.extract(RELATIVE)
+    counts = pd.to_numeric(parts['count'].replace(WORD_COUNTS), errors='coerce')
+    for unit, offset in FIXED_UNITS.items():
+        rows = parts['unit'] == unit
+        if rows.any():
+            resolved[rows] = anchor - pd.to_timedelta(counts[rows], unit=offset)
+    for unit in ('month', 'year'):
+        rows = parts['unit'] == unit
+        for count in counts[rows].unique():
+            resolved[rows & (counts == count)] = anchor - pd.DateOffset(**{unit + 's': int(count)})
+
+    #absolute dates, optionally written as "Dined on Jul 12, 2023"
+    absolute = text.str.replace(r'^(?i:dined\s+on\s+)', '', regex=True)
+    for format in DATE_FORMATS:
+        missing = resolved.isna()
+        if not missing.any():
+            break
+        resolved[missing] = pd.to_datetime(absolute[missing], format=format, errors='coerce')
+
+    return series.map(pd.Series(resolved.values, index=unique))
+
+
+#the reviews of a page with their Date turned into an absolute DATE_FORMAT date, dates that
+#can't be parsed ("No date found") are kept as they are
+def absoluteDates(reviews, anchor=None):
+    if not reviews:
+        return reviews
+    dates = normalizeDates([review['Date'] for review in reviews], anchor)
+    return [review if pd.isna(date) else {**review, 'Date': date.strftime(DATE_FORMAT)}
+            for review, date in zip(reviews, dates)]
+
+
+#the days every scraped date can stand for, as (first, last) 'YYYY-MM-DD' pairs: the day itself for absolute
+#dates, the whole span of a coarse one ("Dined 1 week ago" is 7 to 13 days back), and a day more on both sides
+#of every relative one for the site's clock against ours; (None, None) when the date can't be read
+#a review keeps overlapping its earlier ranges while its date moves from days to weeks to an absolute date
+def dateRanges(dates, anchor=None):
+    anchor = anchorTime(anchor)
+    lower = pd.Series(dates, dtype=object).astype(str).str.strip().str.lower()
+    parts = lower.str.extract(RELATIVE)
+    counts = pd.to_numeric(parts['count'].replace(WORD_COUNTS), errors='coerce')
+
+    last = normalizeDates(dates, anchor).dt.normalize()
+    first = last.copy()
+    #"N weeks ago" reads the same until it is N + 1 weeks, months and years alike
+    for unit in COARSE_UNITS:
+        rows = parts['unit'] == unit
+        for count in counts[rows].unique():
+            first[rows & (counts == count)] = (anchor.normalize() - pd.DateOffset(**{unit + 's': int(count) + 1})
+                                               + pd.Timedelta(days=1))
+    relative = parts['unit'].notna() | lower.str.match(TODAY) | lower.str.match(YESTERDAY)
+    first[relative] -= pd.Timedelta(days=1)
+    last[relative] += pd.Timedelta(days=1)
+    return [(None, None) if pd.isna(end) else (start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d'))
+            for start, end in zip(first, last)]
+
+
+# Helper function to convert date values (including "Dined today" and "Dined X days ago")
+#the per row converter comparison.py used before normalizeDates, kept as the benchmark baseline
+def convert_review_date(date_str):
+
+    date_str = date_str.strip().lower()
+
+    if date_str == 'dined today':
+        return datetime.today()
+
+    if 'dined' in date_str and 'days ago' in date_str:
+        return datetime.today() - timedelta(days=int(date_str.split()[1]))
+
+    if 'dined' in date_str and 'weeks ago' in date_str:
+        return datetime.today() - timedelta(weeks=int(date_str.split()[1]))
+
+    if 'dined' in date_str and 'hours ago' in date_str:
+        return datetime.today() - timedelta(hours=int(date_str.split()[1]))
+
+    try:
+        return datetime.strptime(date_str, '%b %d, %Y')
+    except ValueError:
+        return None
+
+
+def sampleDates(rows, seed=0):
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    days = pd.to_datetime('2020-01-01') + pd.to_timedelta(rng.integers(0, 1500, rows), unit='D')
+    dates = pd.Series(days.strftime(DATE_FORMAT), dtype=object)
+    relative = rng.random(rows) < 0.3
+    units = rng.choice(['days', 'weeks', 'hours'], rows)
+    counts = rng.integers(1, 30, rows).astype(str)
+    dates[relative] = ('Dined ' + pd.Series(counts) + ' ' + pd.Series(units) + ' ago')[relative]
+    dates[rng.random(rows) < 0.05] = 'Dined today'
+    return dates
+
+
+#times the per row apply against normalizeDates on the same dates and checks that they agree
+def benchmarkDates(rows=1_000_000, seed=0):
+    dates = sampleDates(rows, seed)
+
+    start = time.perf_counter()
+    perRow = pd.to_datetime(dates.apply(convert_review_date))
+    applySeconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vectorized = normalizeDates(dates)
+    vectorSeconds = time.perf_counter() - start
+
+    #the per row version calls datetime.today() for every row, compare at day resolution
+    agree = (perRow.dt.normalize() == vectorized.dt.normalize()).mean()
+    print(f'{rows} dates: apply {applySeconds:.2f}s, normalizeDates {vectorSeconds:.2f}s '
+          f'({applySeconds / vectorSeconds:.1f}x), {agree:.2%} identical days')
+    return {'rows': rows, 'apply': applySeconds, 'vectorized': vectorSeconds, 'agree': agree}
+
+
+if __name__ == "__main__":
+    import sys
+
+    benchmarkDates(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,176 @@
+import os
+import re
+import sqlite3
+import threading
+
+from recordio import detectFormat, lastModified, loadRecords
+
+TEXT_COLUMNS = ('review', 'food_comments', 'staff_comments')
+#what the dashboard needs of an archive, nothing else is read from it
+ARCHIVE_COLUMNS = TEXT_COLUMNS + ('sentiment', 'restaurant', 'date')
+#columns the dashboard filters on get a plain b-tree index
+FILTER_COLUMNS = ('sentiment', 'restaurant', 'dined_on')
+#bumped whenever buildIndex changes what it stores, so old index files get rebuilt
+INDEX_VERSION = 3
+
+
+# SQLite copy of the analysis records with an FTS5 index over the review, food and staff comments,
+# so a keyword search is an index lookup instead of three full str.contains scans
+class ReviewIndex:
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.lock = threading.Lock()
+        self.columns = [row[1] for row in conn.execute('PRAGMA table_info(reviews)')]
+        self.size = conn.execute('SELECT COUNT(*) FROM reviews').fetchone()[0]
+
+    def __len__(self):
+        return self.size
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    #WHERE clause and parameters for a keyword: the words of the keyword as a phrase whose last word
+    #may be the start of a longer one ("deli" finds "delicious"), LIKE for input without any word characters
+    def keywordFilter(self, keyword):
+        keyword = (keyword or '').strip()
+        if not keyword:
+            return '', []
+        if re.search(r'\w', keyword):
+            phrase = '"' + keyword.replace('"', '""') + '"*'
+            return 'rowid IN (SELECT rowid FROM reviews_fts WHERE reviews_fts MATCH ?)', [phrase]
+
+        pattern = '%' + keyword.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        clause = ' OR '.join(f"{column} LIKE ? ESCAPE '\\'" for column in TEXT_COLUMNS)
+        return f'({clause})', [pattern] * len(TEXT_COLUMNS)
+
+    #WHERE clause for the keyword and the dashboard filters, an empty string when nothing is filtered
+    #dates are ISO strings (YYYY-MM-DD) so they compare correctly as text
+    def where(self, keyword='', sentiment=None, restaurants=None, since=None, until=None):
+        clauses, params = [], []
+        keywordClause, keywordParams = self.keywordFilter(keyword)
+        if keywordClause:
+            clauses.append(keywordClause)
+            params += keywordParams
+        if sentiment and 'sentiment' in self.columns:
+            clauses.append('sentiment = ?')
+            params.append(sentiment)
+        if restaurants and 'restaurant' in self.columns:
+            clauses.append(f"restaurant IN ({', '.join('?' * len(restaurants))})")
+            params += list(restaurants)
+        if since and 'dined_on' in self.columns:
+            clauses.append('dined_on >= ?')
+            params.append(str(since))
+        if until and 'dined_on' in self.columns:
+            clauses.append('dined_on <= ?')
+            params.append(str(until))
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+    def query(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def count(self, keyword='', **filters):
+        where, params = self.where(keyword, **filters)
+        if not where:
+            return self.size
+        return self.query('SELECT COUNT(*) FROM reviews' + where, params)[0][0]
+
+    #one page of matching rows as dicts, only what is asked for leaves SQLite
+    #(the dashboard renders these directly, pandas isn't needed until an index has to be built)
+    def searchRows(self, keyword='', limit=None, offset=0, **filters):
+        where, params = self.where(keyword, **filters)
+        columns = ', '.join(f'"{column}"' for column in self.columns)
+        sql = f'SELECT {columns} FROM reviews{where} ORDER BY rowid'
+        if limit is not None:
+            sql += ' LIMIT ? OFFSET ?'
+            params = params + [limit, offset]
+        return [dict(zip(self.columns, row)) for row in self.query(sql, params)]
+
+    #the same page as a DataFrame
+    def search(self, keyword='', limit=None, offset=0, **filters):
+        import pandas as pd
+
+        return pd.DataFrame(self.searchRows(keyword, limit, offset, **filters), columns=self.columns)
+
+    #distinct values of a column, for the filter widgets
+    def values(self, column):
+        if column not in self.columns:
+            return []
+        rows = self.query(f'SELECT DISTINCT "{column}" FROM reviews WHERE "{column}" IS NOT NULL ORDER BY 1')
+        return [row[0] for row in rows]
+
+    #first and last date in the data, (None, None) when no review has a known date
+    def dateRange(self):
+        if 'dined_on' not in self.columns:
+            return None, None
+        return tuple(self.query('SELECT MIN(dined_on), MAX(dined_on) FROM reviews')[0])
+
+
+def buildIndex(df, path=':memory:', source=None, sourceMtime=None):
+    import pandas as pd
+
+    #archives keep a failed analysis as nulls, the dashboard shows the 'None' of the JSON files
+    df = df.copy()
+    shown = list(TEXT_COLUMNS) + ['sentiment']
+    for column in shown:
+        if column not in df.columns:
+            df[column] = 'None'
+    df[shown] = df[shown].astype(object).fillna('None').astype(str)
+    if 'date' in df.columns:
+        #relative dates ("Dined 3 days ago") stay NULL here and are never matched by a date filter
+        #archives already hold timestamps, the JSON/CSV files "Jul 12, 2023" strings
+        dined = df['date'] if pd.api.types.is_datetime64_any_dtype(df['date']) else \
+            pd.to_datetime(df['date'], format='%b %d, %Y', errors='coerce')
+        df['dined_on'] = dined.dt.strftime('%Y-%m-%d')
+
+    conn = sqlite3.connect(path, check_same_thread=False)
+    with conn:
+        df.to_sql('reviews', conn, index=False, if_exists='replace')
+        conn.execute('DROP TABLE IF EXISTS reviews_fts')
+        conn.execute(
+            f"CREATE VIRTUAL TABLE reviews_fts USING fts5({', '.join(TEXT_COLUMNS)}, "
+            "content='reviews', content_rowid='rowid')")
+        conn.execute("INSERT INTO reviews_fts(reviews_fts) VALUES ('rebuild')")
+        for column in FILTER_COLUMNS:
+            if column in df.columns:
+                conn.execute(f'CREATE INDEX IF NOT EXISTS reviews_{column} ON reviews ("{column}")')
+
+        #remembers which version of the source file the index was built from
+        conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        conn.executemany('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                         [('source', str(source)), ('source_mtime', repr(sourceMtime)),
+                          ('version', str(INDEX_VERSION))])
+    return ReviewIndex(conn)
+
+
+def indexIsCurrent(indexPath, source, sourceMtime):
+    if not os.path.exists(indexPath):
+        return False
+    try:
+        conn = sqlite3.connect(indexPath)
+        try:
+            meta = dict(conn.execute('SELECT key, value FROM meta').fetchall())
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return False
+    return (meta.get('source') == str(source) and meta.get('source_mtime') == repr(sourceMtime)
+            and meta.get('version') == str(INDEX_VERSION))
+
+
+#index of an analysis file, kept on disk next to it and only rebuilt when the file changed
+def loadIndex(dataPath, indexPath=None):
+    indexPath = indexPath or dataPath.rstrip('/\\') + '.index.db'
+    sourceMtime = lastModified(dataPath)
+
+    if not indexIsCurrent(indexPath, dataPath, sourceMtime):
+        building = indexPath + '.tmp'
+        if os.path.exists(building):
+            os.remove(building)
+        columns = ARCHIVE_COLUMNS if detectFormat(dataPath) == 'archive' else None
+        buildIndex(loadRecords(dataPath, columns=columns), building, dataPath, sourceMtime).close()
+        os.replace(building, indexPath)
+
+    return ReviewIndex(sqlite3.connect(indexPath, check_same_thread=False))
@@ -0,0 +1,201 @@
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from metrics import printHistograms
+from httpscraper import createSession, iterReviewPagesHttp
+from main import collectPages, createDriver, extractNameFromURL, iterReviewPages, saveReviews
+
+
+# pool of reusable headless browser sessions, drivers are created lazily up to size
+class BrowserPool:
+
+    def __init__(self, size=4, headless=True):
+        self.size = size
+        self.headless = headless
+        self.idle = queue.Queue()
+        self.created = 0
+        self.lock = threading.Lock()
+        self.drivers = []
+
+    def acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self.lock:
+            if self.created < self.size:
+                self.created += 1
+                create = True
+            else:
+                create = False
+
+        if create:
+            try:
+                driver = createDriver(headless=self.headless)
+            except Exception:
+                with self.lock:
+                    self.created -= 1
+                raise
+            with self.lock:
+                self.drivers.append(driver)
+            return driver
+
+        #every session is busy, wait for one to be released
+        return self.idle.get()
+
+    def release(self, driver):
+        self.idle.put(driver)
+
+    #drops a broken session so the next acquire starts a fresh browser
+    def discard(self, driver):
+        with self.lock:
+            if driver in self.drivers:
+                self.drivers.remove(driver)
+            self.created -= 1
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def close(self):
+        with self.lock:
+            drivers, self.drivers = self.drivers, []
+            self.created = 0
+        for driver in drivers:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+
+
+class ScrapeStats:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pages = 0
+        self.reviews = 0
+        self.failed = []
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def add(self, pages, reviews):
+        with self.lock:
+            self.pages += pages
+            self.reviews += reviews
+
+    def addFailure(self, url):
+        with self.lock:
+            self.failed.append(url)
+
+    def stop(self):
+        self.finished = time.perf_counter()
+
+    def elapsed(self):
+        end = self.finished if self.finished is not None else time.perf_counter()
+        return end - self.started
+
+    def pagesPerSec(self):
+        elapsed = self.elapsed()
+        return self.pages / elapsed if elapsed else 0.0
+
+    def reviewsPerSec(self):
+        elapsed = self.elapsed()
+        return self.reviews / elapsed if elapsed else 0.0
+
+    def summary(self):
+        return {
+            'pages': self.pages,
+            'reviews': self.reviews,
+            'failed': list(self.failed),
+            'seconds': round(self.elapsed(), 3),
+            'pages_per_sec': round(self.pagesPerSec(), 3),
+            'reviews_per_sec': round(self.reviewsPerSec(), 3),
+        }
+
+
+def scrapeWithRetry(pool, url, stats, retries=3, backoff=2.0, maxPages=100, pageWait='event', session=None,
+                    store=None, stopAfterKnown=None):
+    for attempt in range(1, retries + 1):
+        driver = None
+        reviewsData = []
+        try:
+            #with a store every retry continues from the last checkpointed page
+            startPage, startUrl = store.resumePoint(url) if store is not None else (1, None)
+            if session is not None:
+                pageIter = iterReviewPagesHttp(session, url, maxPages, startPage, startUrl)
+            else:
+                driver = pool.acquire()
+                pageIter = iterReviewPages(driver, url, maxPages, pageWait, startPage, startUrl)
+
+            pages = collectPages(pageIter, url, reviewsData, store, stopAfterKnown)
+            if driver is not None:
+                pool.release(driver)
+
+            #counted only once the restaurant went through, so retries are not counted twice
+            stats.add(pages, len(reviewsData))
+            return reviewsData
+
+        except Exception as e:
+            if driver is not None:
+                pool.discard(driver)
+            print(f"Error scraping {url} (attempt {attempt}/{retries}): {e}")
+            if attempt < retries:
+                #exponential backoff with jitter so the workers don't retry in lockstep
+                time.sleep(backoff * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5))
+
+    if session is not None:
+        print(f"HTTP scraping failed for {url}, falling back to selenium")
+        return scrapeWithRetry(pool, url, stats, retries, backoff, maxPages, pageWait, None, store, stopAfterKnown)
+
+    stats.addFailure(url)
+    return []
+
+
+# scrapes a list of OpenTable urls over a bounded pool of reused browser sessions
+# backend='http' shares one pooled HTTP session instead and only starts browsers for fallbacks
+# with a store (store.ReviewStore) pages are checkpointed and stopAfterKnown ends a refresh early
+def scrapeRestaurants(urls, workers=4, retries=3, backoff=2.0, maxPages=100, headless=True, save=True,
+                      pageWait='event', backend='selenium', store=None, stopAfterKnown=None):
+    urls = list(dict.fromkeys(urls))
+    pool = BrowserPool(size=min(workers, len(urls)) or 1, headless=headless)
+    session = createSession(poolSize=pool.size) if backend == 'http' else None
+    stats = ScrapeStats()
+    results = {}
+
+    try:
+        with ThreadPoolExecutor(max_workers=pool.size) as executor:
+            futures = {
+                executor.submit(scrapeWithRetry, pool, url, stats, retries, backoff, maxPages, pageWait, session,
+                                store, stopAfterKnown): url
+                for url in urls
+            }
+            for future in as_completed(futures):
+                url = futures[future]
+                reviewsData = future.result()
+                results[url] = reviewsData
+                if save and reviewsData:
+                    restaurant_name = extractNameFromURL(url)
+                    saveReviews(store.reviews(restaurant_name) if store is not None else reviewsData, restaurant_name)
+    finally:
+        pool.close()
+        if session is not None:
+            session.close()
+        stats.stop()
+
+    summary = stats.summary()
+    print(f"Scraped {summary['reviews']} reviews from {summary['pages']} pages in {summary['seconds']}s "
+          f"({summary['pages_per_sec']} pages/sec, {summary['reviews_per_sec']} reviews/sec)")
+    #where the wall-clock went: initial load, page transitions, parsing and refreshes
+    printHistograms('scrape.')
+    return results, stats
+
+
+if __name__ == "__main__":
+    import sys
+
+    # python scraper.py <url> [<url> ...]
+    scrapeRestaurants(sys.argv[1:])
@@ -0,0 +1,178 @@
+import hashlib
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+RATING_COLUMNS = ('Overall', 'Food', 'Service', 'Ambience')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS reviews (
+    hash TEXT PRIMARY KEY,
+    restaurant TEXT NOT NULL,
+    review TEXT NOT NULL,
+    date TEXT NOT NULL,
+    overall TEXT,
+    food TEXT,
+    service TEXT,
+    ambience TEXT,
+    url TEXT,
+    page INTEGER,
+    scraped_at TEXT,
+    content TEXT,
+    date_from TEXT,
+    date_to TEXT
+);
+CREATE INDEX IF NOT EXISTS reviews_restaurant ON reviews (restaurant);
+
+CREATE TABLE IF NOT EXISTS checkpoints (
+    url TEXT PRIMARY KEY,
+    restaurant TEXT,
+    page INTEGER NOT NULL,
+    page_url TEXT,
+    complete INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT
+);
+'''
+
+
+def now():
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+#row key: restaurant, review text and the date the review was first stored with
+def reviewHash(record):
+    key = '\x1f'.join((record['Restaurant Name'], record['Review'], record['Date']))
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+#restaurant and review text, the same review is a row with this hash and a date range overlapping its own
+def contentHash(restaurant, review):
+    return hashlib.sha256('\x1f'.join((restaurant, review)).encode('utf-8')).hexdigest()
+
+
+#(first, last) date ranges overlap, a missing bound matches any date
+def overlaps(stored, scraped):
+    return ((stored[0] is None or scraped[1] is None or stored[0] <= scraped[1])
+            and (scraped[0] is None or stored[1] is None or scraped[0] <= stored[1]))
+
+
+def daySpan(dates):
+    if None in dates:
+        return float('inf')
+    return (datetime.fromisoformat(dates[1]) - datetime.fromisoformat(dates[0])).days
+
+
+# sqlite backed review store with a per-page checkpoint for every scraped url
+class ReviewStore:
+
+    def __init__(self, path='reviews.db'):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        self.migrate()
+
+    #stores written before reviews were matched on date ranges get the new columns, their rows match any date
+    def migrate(self):
+        columns = {row[1] for row in self.conn.execute('PRAGMA table_info(reviews)')}
+        with self.conn:
+            for column in ('content', 'date_from', 'date_to'):
+                if column not in columns:
+                    self.conn.execute(f'ALTER TABLE reviews ADD COLUMN {column} TEXT')
+            rows = self.conn.execute('SELECT rowid, restaurant, review FROM reviews WHERE content IS NULL').fetchall()
+            self.conn.executemany('UPDATE reviews SET content = ? WHERE rowid = ?',
+                                  [(contentHash(restaurant, review), rowid) for rowid, restaurant, review in rows])
+            self.conn.execute('CREATE INDEX IF NOT EXISTS reviews_content ON reviews (content)')
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    #the stored row of a review whose date range overlaps dates, as (rowid, date_from, date_to)
+    def match(self, record, dates):
+        rows = self.conn.execute('SELECT rowid, date_from, date_to FROM reviews WHERE content = ?',
+                                 (contentHash(record['Restaurant Name'], record['Review']),)).fetchall()
+        return next((row for row in rows if overlaps(row[1:], dates)), None)
+
+    #stores one page and moves the url's checkpoint to it, returns a new/known flag per review
+    #dateRanges (reviewdates.dateRanges) are the days each scraped date can stand for: a review whose text is
+    #stored with an overlapping range is known, and the row takes over the narrower range and its date
+    def addPage(self, url, page, pageReviews, pageUrl=None, dateRanges=None):
+        dateRanges = dateRanges or [(None, None)] * len(pageReviews)
+
+        with self.lock, self.conn:
+            isNew = []
+            for r, dates in zip(pageReviews, dateRanges):
+                row = self.match(r, dates)
+                if row is not None:
+                    if daySpan(dates) < daySpan(row[1:]):
+                        self.conn.execute('UPDATE reviews SET date = ?, date_from = ?, date_to = ? WHERE rowid = ?',
+                                          (r['Date'],) + tuple(dates) + (row[0],))
+                    isNew.append(False)
+                    continue
+                cursor = self.conn.execute(
+                    'INSERT OR IGNORE INTO reviews VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (reviewHash(r), r['Restaurant Name'], r['Review'], r['Date'], r['Overall'], r['Food'],
+                     r['Service'], r['Ambience'], url, page, now(),
+                     contentHash(r['Restaurant Name'], r['Review'])) + tuple(dates))
+                isNew.append(cursor.rowcount == 1)
+
+            restaurant = pageReviews[0]['Restaurant Name'] if pageReviews else None
+            self.conn.execute(
+                '''INSERT INTO checkpoints (url, restaurant, page, page_url, complete, updated_at)
+                   VALUES (?, ?, ?, ?, 0, ?)
+                   ON CONFLICT(url) DO UPDATE SET restaurant = COALESCE(excluded.restaurant, restaurant),
+                       page = excluded.page, page_url = excluded.page_url, complete = 0,
+                       updated_at = excluded.updated_at''',
+                (url, restaurant, page, pageUrl, now()))
+        return isNew
+
+    #the run reached the last page (or caught up with known reviews), the next run starts over
+    def finish(self, url):
+        with self.lock, self.conn:
+            self.conn.execute('UPDATE checkpoints SET complete = 1, updated_at = ? WHERE url = ?', (now(), url))
+
+    #(page, page url) to resume an interrupted run from, (1, None) when there is nothing to resume
+    def resumePoint(self, url):
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT page, page_url, complete FROM checkpoints WHERE url = ?', (url,)).fetchone()
+        if not row or row[2]:
+            return 1, None
+        return row[0], row[1]
+
+    def isKnown(self, record, dates=(None, None)):
+        with self.lock:
+            return self.match(record, dates) is not None
+
+    def count(self, restaurant=None):
+        query, params = 'SELECT COUNT(*) FROM reviews', ()
+        if restaurant:
+            query, params = query + ' WHERE restaurant = ?', (restaurant,)
+        with self.lock:
+            return self.conn.execute(query, params).fetchone()[0]
+
+    #records in the same shape as scrapReviews returns them, in scrape order
+    def reviews(self, restaurant=None):
+        query = 'SELECT restaurant, review, date, overall, food, service, ambience FROM reviews'
+        params = ()
+        if restaurant:
+            query += ' WHERE restaurant = ?'
+            params = (restaurant,)
+        query += ' ORDER BY rowid'
+
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+        return [
+            {'Restaurant Name': row[0], 'Review': row[1], 'Date': row[2],
+             'Overall': row[3], 'Food': row[4], 'Service': row[5], 'Ambience': row[6]}
+            for row in rows
+        ]
@@ -0,0 +1,135 @@
+import functools
+import itertools
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+
+# serves a directory of saved OpenTable pages on localhost so the scrapers can run offline
+def serveFixtures(directory=FIXTURES_DIR, port=0):
+    handler = functools.partial(QuietHandler, directory=directory)
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    host, port = server.server_address
+    return server, f'http://{host}:{port}'
+
+
+POSITIVE_WORDS = ('great', 'amazing', 'delicious', 'perfect', 'best', 'lovely', 'friendly', 'attentive', 'excellent')
+FOOD_WORDS = ('food', 'dish', 'duck', 'gumbo', 'steak', 'pasta', 'brunch', 'seafood', 'beignets', 'cocktails', 'tasted')
+STAFF_WORDS = ('staff', 'server', 'service', 'waiter', 'bartender', 'host', 'waited')
+
+
+#first sentence of the review that mentions one of the words, the way the model quotes the review
+def mockComment(review, words):
+    for sentence in re.split(r'(?<=[.!?])\s+', review):
+        if any(word in sentence.lower() for word in words):
+            return sentence
+    return 'None'
+
+
+def mockAnalysis(id, review):
+    positive = any(word in review.lower() for word in POSITIVE_WORDS)
+    return {
+        'id': id,
+        'food_comments': mockComment(review, FOOD_WORDS),
+        'staff_comments': mockComment(review, STAFF_WORDS),
+        'sentiment': 'positive' if positive else 'negative',
+    }
+
+
+# answers POST /v1/messages like the Messages API, with injectable latency and 429/529 failures
+class MockMessagesHandler(BaseHTTPRequestHandler):
+
+    latency = 0.0
+    failEvery = 0
+    failStatus = 429
+    counter = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def sendJson(self, status, body, headers=()):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        number = next(self.counter)
+        if self.latency:
+            time.sleep(self.latency)
+
+        if self.failEvery and number % self.failEvery == 0:
+            self.sendJson(self.failStatus, {
+                'type': 'error',
+                'error': {'type': 'rate_limit_error' if self.failStatus == 429 else 'overloaded_error',
+                          'message': 'mock failure'},
+            }, headers=[('retry-after', '0')])
+            return
+
+        prompt = request['messages'][0]['content']
+        analyses = [mockAnalysis(id, review) for id, review in re.findall(r'^\[(r\d+)\] (.*)$', prompt, re.M)]
+
+        if request.get('tools'):
+            text = json.dumps({'analyses': analyses})
+            content = [{'type': 'tool_use', 'id': f'toolu_mock_{number}', 'name': request['tools'][0]['name'],
+                        'input': {'analyses': analyses}}]
+            stopReason = 'tool_use'
+        else:
+            text = json.dumps(analyses, indent=4)
+            #cut the answer off like the API does when it runs into max_tokens
+            limit = request.get('max_tokens', 1000) * 4
+            stopReason = 'max_tokens' if len(text) > limit else 'end_turn'
+            text = text[:limit]
+            content = [{'type': 'text', 'text': text}]
+
+        self.sendJson(200, {
+            'id': f'msg_mock_{number}',
+            'type': 'message',
+            'role': 'assistant',
+            'model': request.get('model'),
+            'content': content,
+            'stop_reason': stopReason,
+            'stop_sequence': None,
+            'usage': {'input_tokens': len(prompt) // 4, 'output_tokens': len(text) // 4},
+        })
+
+
+#local stand-in for the Messages API, point the client at it with base_url
+def serveMockMessages(latency=0.0, failEvery=0, failStatus=429, port=0):
+    handler = type('MockMessages', (MockMessagesHandler,), {
+        'latency': latency, 'failEvery': failEvery, 'failStatus': failStatus, 'counter': itertools.count(1),
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    host, port = server.server_address
+    return server, f'http://{host}:{port}'
+
+
+if __name__ == "__main__":
+    server, baseUrl = serveFixtures(port=8000)
+    print(f'Serving fixtures at {baseUrl}/fixture-bistro/')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,54 @@
+import os
+import sys
+
+import pytest
+
+#the modules live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stubserver import FIXTURES_DIR, serveFixtures, serveMockMessages  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def fixtureUrl():
+    server, baseUrl = serveFixtures()
+    yield f'{baseUrl}/fixture-bistro/'
+    server.shutdown()
+
+
+#(html, page number) of every saved fixture page, in page order
+@pytest.fixture(scope='session')
+def fixturePages():
+    directory = os.path.join(FIXTURES_DIR, 'fixture-bistro')
+    pages = []
+    for number, name in enumerate(('index.html', 'page2.html'), 1):
+        with open(os.path.join(directory, name), 'r', encoding='utf-8') as f:
+            pages.append((f.read(), number))
+    return pages
+
+
+#starts mock Messages APIs (stubserver.serveMockMessages options) and returns their base urls
+@pytest.fixture
+def mockMessages(monkeypatch):
+    monkeypatch.setenv('ANTHROPIC_API_KEY', 'test')
+    servers = []
+
+    def start(**options):
+        server, baseUrl = serveMockMessages(**options)
+        servers.append(server)
+        return baseUrl
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+#scraped records with food and staff sentences, every other one positive
+@pytest.fixture
+def scrapedReviews():
+    def make(count):
+        return [{'Restaurant Name': 'Fixture Bistro', 'Date': 'Jan 05, 2024',
+                 'Review': f'Review {i}: the food was delicious and the waiter was friendly.' if i % 2 else
+                           f'Review {i}: the pasta was cold and the staff ignored us.'}
+                for i in range(count)]
+    return make
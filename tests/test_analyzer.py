@@ -0,0 +1,47 @@
+import time
+
+from analyzer import analyzeBatches
+from main import generateReviewsAnalysis
+from recordio import readRecords
+
+FAST = {'requestsPerMinute': 60000, 'backoff': 0.01}
+
+
+def test_results_stay_in_input_order(tmp_path, mockMessages, scrapedReviews):
+    baseUrl = mockMessages(latency=0.05)
+    reviews = scrapedReviews(40)
+    output = str(tmp_path / 'analysis.jsonl')
+
+    generateReviewsAnalysis(reviews, 5, output=output, concurrency=4, baseUrl=baseUrl, **FAST)
+
+    records = readRecords(output)
+    assert [record['review'] for record in records] == [review['Review'] for review in reviews]
+    assert [record['sentiment'] for record in records] == ['negative', 'positive'] * 20
+    assert all(record['restaurant'] == 'Fixture Bistro' for record in records)
+
+
+#every third request gets a 429 (or 529), the retries still get every review analyzed
+def test_retries_rate_limited_and_overloaded_requests(tmp_path, mockMessages, scrapedReviews):
+    for status in (429, 529):
+        baseUrl = mockMessages(failEvery=3, failStatus=status)
+        output = str(tmp_path / f'analysis-{status}.jsonl')
+
+        generateReviewsAnalysis(scrapedReviews(30), 5, output=output, concurrency=4, baseUrl=baseUrl, **FAST)
+
+        records = readRecords(output)
+        assert len(records) == 30
+        assert all(record['sentiment'] in ('positive', 'negative') for record in records)
+
+
+def test_batches_run_concurrently(mockMessages, scrapedReviews):
+    baseUrl = mockMessages(latency=0.3)
+    batches = [[review['Review'] for review in scrapedReviews(40)[i:i + 5]] for i in range(0, 40, 5)]
+    done = []
+
+    started = time.perf_counter()
+    analyzeBatches(batches, lambda batch, results: done.append(results), concurrency=8, baseUrl=baseUrl, **FAST)
+    elapsed = time.perf_counter() - started
+
+    assert len(done) == 8 and all(None not in results for results in done)
+    #one after the other would take 8 x 0.3s
+    assert elapsed < 1.2
@@ -0,0 +1,46 @@
+from backends import LocalBackend, TriageBackend
+from main import generateReviewsAnalysis, openAnalysisCache
+from recordio import readRecords
+
+FAST = {'requestsPerMinute': 60000, 'backoff': 0.01}
+
+
+#a local backend isn't held to the API path's 900 reviews, its chunks run in worker processes
+def test_local_backend_analyzes_every_review(tmp_path, scrapedReviews):
+    reviews = scrapedReviews(2500)
+    output = str(tmp_path / 'analysis.jsonl')
+
+    generateReviewsAnalysis(reviews, 10, output=output, backend=LocalBackend(), workers=2)
+
+    records = readRecords(output)
+    assert [record['review'] for record in records] == [review['Review'] for review in reviews]
+    assert [record['sentiment'] for record in records[:4]] == ['negative', 'positive'] * 2
+    assert records[1]['food_comments'] != 'None'
+
+
+#the local pass covers every review, only the ambiguous ones (at most 900) go through the API and its cache
+def test_triage_escalates_through_the_api_path(tmp_path, mockMessages, scrapedReviews):
+    baseUrl = mockMessages()
+    reviews = scrapedReviews(2500)
+    for i in range(0, 2000, 2):
+        reviews[i]['Review'] = f'Review {i}: we went there on a Tuesday.'
+    cache = openAnalysisCache(str(tmp_path / 'cache.db'))
+    output = str(tmp_path / 'analysis.jsonl')
+
+    triage = TriageBackend()
+    generateReviewsAnalysis(reviews, 10, output=output, cache=cache, backend=triage, workers=2, concurrency=4,
+                            baseUrl=baseUrl, **FAST)
+
+    records = readRecords(output)
+    assert [record['review'] for record in records] == [review['Review'] for review in reviews]
+    assert triage.escalated == 900
+    #the mock calls a review without positive words negative, the local engine leaves it positive
+    assert {records[i]['sentiment'] for i in range(0, 1800, 2)} == {'negative'}
+    assert {records[i]['sentiment'] for i in range(1800, 2000, 2)} == {'positive'}
+    assert cache.stats()['entries'] == 900
+
+    #the next run finds Claude's answers in the cache and escalates the rest
+    triage = TriageBackend()
+    generateReviewsAnalysis(reviews, 10, output=output, cache=cache, backend=triage, workers=2, concurrency=4,
+                            baseUrl=baseUrl, **FAST)
+    assert triage.escalated == 100
@@ -0,0 +1,55 @@
+import asyncio
+
+import anthropic
+
+import main
+from analyzer import AsyncAnalyzer
+from batching import estimateOutputTokens, estimateTokens, packBatches, splitMissing, summarizeUsage
+
+
+def test_batches_stay_within_token_budgets():
+    reviews = [f'Review {i} ' + 'very long text ' * (i % 7 * 20) for i in range(200)]
+    batches = packBatches(reviews, maxInputTokens=1500, maxOutputTokens=600, maxReviews=20)
+
+    assert [review for batch in batches for review in batch] == reviews
+    for batch in batches:
+        assert len(batch) <= 20
+        if len(batch) > 1:
+            assert sum(estimateTokens(review) for review in batch) <= 1500
+            assert sum(estimateOutputTokens(review) for review in batch) <= 600 * 0.8
+
+
+def test_split_missing_halves_only_the_missing_reviews():
+    reviews = ['a', 'b', 'c', 'd', 'e']
+    assert splitMissing(reviews, [{}, None, None, {}, None]) == [['b'], ['c', 'e']]
+    assert splitMissing(reviews, [{}, {}, None, {}, {}]) == [['c']]
+    assert splitMissing(reviews, [{}] * 5) == []
+
+
+#the mock cuts its answer off at max_tokens, the salvaged results are kept and only the rest is sent again
+def test_truncated_batches_are_split(monkeypatch, mockMessages, scrapedReviews):
+    baseUrl = mockMessages()
+    monkeypatch.setattr(main, 'client', anthropic.Anthropic(base_url=baseUrl, max_retries=0))
+    reviews = [review['Review'] for review in scrapedReviews(8)]
+    usageLog = []
+
+    results = main.analyzeBatch(reviews, usageLog, maxTokens=150)
+
+    assert all(result is not None for result in results)
+    assert [result['sentiment'] for result in results] == ['negative', 'positive'] * 4
+    usage = summarizeUsage(usageLog)
+    assert usage['truncated'] > 0
+    assert usage['requests'] < 2 * len(reviews)
+
+
+def test_truncated_batches_are_split_async(mockMessages, scrapedReviews):
+    baseUrl = mockMessages()
+    reviews = [review['Review'] for review in scrapedReviews(8)]
+
+    async def run():
+        async with AsyncAnalyzer(concurrency=4, requestsPerMinute=60000, baseUrl=baseUrl) as analyzer:
+            return await analyzer.analyzeBatch(reviews, maxTokens=150), analyzer.usageLog
+
+    results, usageLog = asyncio.run(run())
+    assert [result['sentiment'] for result in results] == ['negative', 'positive'] * 4
+    assert summarizeUsage(usageLog)['truncated'] > 0
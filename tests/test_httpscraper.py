@@ -0,0 +1,80 @@
+import main
+from extract import parseReviewPageFast
+from httpscraper import createSession, iterReviewPagesHttp, nextPageUrl
+
+RESTAURANT = 'Fixture Bistro'
+
+
+def test_fast_parser_matches_soup_parser(fixturePages):
+    for html, page in fixturePages:
+        records = main.parseReviewPage(html, RESTAURANT, page)
+        assert records
+        assert parseReviewPageFast(html, RESTAURANT, page) == records
+
+
+def test_next_page_url(fixturePages):
+    (first, _), (last, _) = fixturePages
+    assert nextPageUrl(first, 'http://host/fixture-bistro/') == 'http://host/fixture-bistro/page2.html'
+    #the last page's link is disabled
+    assert nextPageUrl(last, 'http://host/fixture-bistro/page2.html') is None
+    assert nextPageUrl('<a href="p3.html?a=1&amp;b=2" aria-label="Go to the next page">', 'http://host/r/') \
+        == 'http://host/r/p3.html?a=1&b=2'
+    assert nextPageUrl('<p>no pagination</p>', 'http://host/r/') is None
+
+
+#the http backend returns the records the browser path parses from the same pages
+def test_http_pages_match_browser_parser(fixtureUrl, fixturePages):
+    session = createSession()
+    try:
+        pages = list(iterReviewPagesHttp(session, fixtureUrl))
+    finally:
+        session.close()
+
+    assert [page for page, _, _ in pages] == [1, 2]
+    for (_, records, _), (html, page) in zip(pages, fixturePages):
+        assert records == main.parseReviewPage(html, RESTAURANT, page)
+
+
+def test_scrape_over_http(fixtureUrl, fixturePages):
+    records = main.scrapReviews(fixtureUrl, save=False, backend='http')
+
+    expected = [record for html, page in fixturePages for record in main.parseReviewPage(html, RESTAURANT, page)]
+    assert [record['Review'] for record in records] == [record['Review'] for record in expected]
+    #relative dates are stored as absolute ones
+    assert not any(record['Date'].lower().startswith('dined') for record in records)
+
+
+#a failure after the first page continues in the browser on the next page, without repeating records
+def test_fallback_continues_after_last_http_page(tmp_path, monkeypatch, fixturePages):
+    from stubserver import serveFixtures
+
+    site = tmp_path / 'fixture-bistro'
+    site.mkdir()
+    (site / 'index.html').write_text(fixturePages[0][0], encoding='utf-8')
+    server, baseUrl = serveFixtures(str(tmp_path))
+
+    started = []
+
+    def browserPages(driver, url, maxPages, pageWait, startPage, startUrl):
+        started.append((startPage, startUrl))
+        return iter(())
+
+    monkeypatch.setattr(main, 'iterReviewPages', browserPages)
+    monkeypatch.setattr(main, 'createDriver', lambda: type('Driver', (), {'quit': lambda self: None})())
+    try:
+        records = main.scrapReviews(f'{baseUrl}/fixture-bistro/', save=False, backend='http')
+    finally:
+        server.shutdown()
+
+    assert started == [(2, None)]
+    assert len(records) == len({record['Review'] for record in records}) == 5
+
+
+#restaurants sharing a first word get their own files
+def test_saved_reviews_are_named_after_the_whole_restaurant(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for url in ('https://www.opentable.com/r/the-pink-door-seattle', 'https://www.opentable.com/r/the-walrus'):
+        main.saveReviews([{'Review': url}], main.extractNameFromURL(url))
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['the_pink_door_seattle_reviews.json',
+                                                                'the_walrus_reviews.json']
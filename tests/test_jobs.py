@@ -0,0 +1,48 @@
+import sqlite3
+import time
+
+from jobs import STALE_AFTER, JobQueue
+
+
+def test_running_jobs_of_live_workers_are_not_requeued(tmp_path):
+    with JobQueue(str(tmp_path / 'jobs.db')) as queue:
+        jobId = queue.submit('scrape', 'https://example.com/r', {'url': 'https://example.com/r'})
+        assert queue.claimNext(worker=1234)['id'] == jobId
+
+        #a second server starting on the same table
+        queue.requeueRunning()
+        assert queue.get(jobId)['status'] == 'running'
+        assert queue.claimNext(worker=5678) is None
+
+        #the worker stopped beating
+        queue.execute('UPDATE jobs SET heartbeat = ? WHERE id = ?', (time.time() - STALE_AFTER - 1, jobId))
+        queue.requeueRunning()
+        assert queue.get(jobId)['status'] == 'queued'
+        assert queue.claimNext(worker=5678)['worker'] == 5678
+
+
+def test_beat_keeps_a_job_claimed(tmp_path):
+    with JobQueue(str(tmp_path / 'jobs.db')) as queue:
+        jobId = queue.submit('scrape', 'k', {})
+        queue.claimNext(worker=1)
+        queue.execute('UPDATE jobs SET heartbeat = ? WHERE id = ?', (time.time() - STALE_AFTER - 1, jobId))
+        queue.beat(1)
+        queue.requeueRunning()
+        assert queue.get(jobId)['status'] == 'running'
+
+
+#a table from before the heartbeat: its running jobs have no worker and are requeued as before
+def test_old_tables_get_the_worker_columns(tmp_path):
+    path = str(tmp_path / 'jobs.db')
+    conn = sqlite3.connect(path)
+    conn.execute("""CREATE TABLE jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, key TEXT NOT NULL,
+                    params TEXT NOT NULL, status TEXT NOT NULL DEFAULT 'queued', done INTEGER NOT NULL DEFAULT 0,
+                    total INTEGER, items INTEGER NOT NULL DEFAULT 0, result TEXT, error TEXT, created_at TEXT,
+                    started_at REAL, updated_at REAL, finished_at REAL)""")
+    conn.execute("INSERT INTO jobs (kind, key, params, status) VALUES ('scrape', 'k', '{}', 'running')")
+    conn.commit()
+    conn.close()
+
+    with JobQueue(path) as queue:
+        queue.requeueRunning()
+        assert queue.get(1)['status'] == 'queued'
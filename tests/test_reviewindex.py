@@ -0,0 +1,22 @@
+import main
+from archive import ArchiveWriter
+from reviewindex import loadIndex
+
+
+#a review whose analysis failed is archived with null comments and sentiment and shown as 'None'
+def test_index_of_an_archive_with_a_failed_analysis(tmp_path):
+    path = str(tmp_path / 'reviews_analysis.archive')
+    with ArchiveWriter(path, scrapedAt='2026-10-18') as writer:
+        writer.write([
+            {'restaurant': 'Fixture Bistro', 'date': 'Oct 12, 2026', 'review': 'Great pasta.',
+             'food_comments': 'Great pasta.', 'staff_comments': 'None', 'sentiment': 'positive'},
+            dict(main.normalizeAnalysis({'review': 'Lost in the batch.'}), restaurant='Fixture Bistro',
+                 date='Oct 11, 2026'),
+        ])
+
+    index = loadIndex(path)
+    rows = {row['review']: row for row in index.searchRows()}
+    assert rows['Lost in the batch.']['sentiment'] == 'None'
+    assert rows['Lost in the batch.']['food_comments'] == 'None'
+    assert index.values('sentiment') == ['None', 'positive']
+    assert len(index.searchRows(sentiment='positive')) == 1
@@ -0,0 +1,69 @@
+import pytest
+
+import main
+from store import ReviewStore
+
+URL = 'https://example.com/r/fixture-bistro'
+
+
+def record(review, date):
+    return {'Restaurant Name': 'Fixture Bistro', 'Review': review, 'Date': date,
+            'Overall': '5', 'Food': '5', 'Service': '4', 'Ambience': '4'}
+
+
+def scrape(store, pages, anchor, stopAfterKnown=None):
+    pageIter = ((number, reviews, f'{URL}?page={number}') for number, reviews in enumerate(pages, 1))
+    return main.collectPages(pageIter, URL, [], store, stopAfterKnown, anchor=anchor)
+
+
+#the same review read as days, then weeks, then an absolute date is one row, and known on every later scrape
+def test_review_is_known_while_its_date_gets_coarser(tmp_path):
+    with ReviewStore(str(tmp_path / 'reviews.db')) as store:
+        scrape(store, [[record('Lovely pasta.', 'Dined 6 days ago')]], '2026-10-18 20:00')
+        scrape(store, [[record('Lovely pasta.', 'Dined 1 week ago')]], '2026-10-19 20:00')
+        scrape(store, [[record('Lovely pasta.', 'Oct 12, 2026')]], '2026-11-30 20:00')
+
+        assert store.reviews() == [record('Lovely pasta.', 'Oct 12, 2026')]
+        assert store.isKnown(record('Lovely pasta.', 'Oct 12, 2026'), ('2026-10-12', '2026-10-12'))
+        assert not store.isKnown(record('Lovely pasta.', 'Oct 12, 2025'), ('2025-10-12', '2025-10-12'))
+
+
+#the same text on a date the stored one can't stand for is another review
+def test_same_text_on_another_date_is_new(tmp_path):
+    with ReviewStore(str(tmp_path / 'reviews.db')) as store:
+        scrape(store, [[record('Great!', 'Dined 2 days ago')]], '2026-10-18 20:00')
+        scrape(store, [[record('Great!', 'Dined 3 weeks ago')]], '2026-10-18 20:00')
+        assert [r['Date'] for r in store.reviews()] == ['Oct 16, 2026', 'Sep 27, 2026']
+
+
+def test_stop_after_known_across_unit_changes(tmp_path):
+    first = [record(f'Review {i}', 'Dined 6 days ago') for i in range(3)]
+    older = [record(f'Older {i}', 'Dined 2 weeks ago') for i in range(3)]
+    with ReviewStore(str(tmp_path / 'reviews.db')) as store:
+        assert scrape(store, [first, older], '2026-10-18 20:00') == 2
+
+        #a day later the first page reads "1 week ago" and a new review is on top
+        again = [record('Fresh', 'Dined today')] + [record(f'Review {i}', 'Dined 1 week ago') for i in range(3)]
+        assert scrape(store, [again, older], '2026-10-19 20:00', stopAfterKnown=3) == 1
+        assert store.count() == 7
+
+
+def test_resume_after_an_interrupted_run(tmp_path):
+    pages = [[record(f'Page {page} review {i}', 'Dined 6 days ago') for i in range(2)] for page in range(1, 4)]
+
+    def interrupted():
+        yield 1, pages[0], f'{URL}?page=1'
+        yield 2, pages[1], f'{URL}?page=2'
+        raise ConnectionError('page 3')
+
+    with ReviewStore(str(tmp_path / 'reviews.db')) as store:
+        with pytest.raises(ConnectionError):
+            main.collectPages(interrupted(), URL, [], store, anchor='2026-10-18 20:00')
+        assert store.resumePoint(URL) == (2, f'{URL}?page=2')
+
+        #the resumed run rereads page 2 a day later, with its dates a unit coarser
+        resumed = [[record(r['Review'], 'Dined 1 week ago') for r in pages[1]], pages[2]]
+        pageIter = ((number, reviews, f'{URL}?page={number}') for number, reviews in zip((2, 3), resumed))
+        main.collectPages(pageIter, URL, [], store, anchor='2026-10-19 20:00')
+        assert store.count() == 6
+        assert store.resumePoint(URL) == (1, None)